@@ -1,11 +1,24 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, has_request_context, jsonify, request, send_from_directory, stream_with_context
 from flask_cors import CORS
+import bisect
 import json
+import mimetypes
 import random
 import itertools
 import os
+import re
+import sys
+import tempfile
+import gzip
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
 
+import formats
+
 
 # Determine paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,8 +29,8 @@ if not os.path.exists(STATIC_DIR):
     # In Docker, static files are at /app/static
     STATIC_DIR = os.path.join(os.path.dirname(BASE_DIR), 'static')
 
-# Initialize Flask app with static files configuration
-app = Flask(__name__, static_folder=STATIC_DIR, static_url_path='')
+# Initialize Flask app; the SPA in STATIC_DIR is served from memory by serve_static()
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 # Database connection parameters from environment variables with fallbacks
@@ -30,11 +43,22 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 # Configure SQLAlchemy
 app.config["SQLALCHEMY_DATABASE_URI"] = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False # Disable tracking modifications for performance
+# Connection pool, per worker process (see gunicorn.conf.py for worker/thread counts)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+}
 db = SQLAlchemy(app)
 
 # Import necessary for GeoAlchemy2
 from geoalchemy2 import Geometry
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, case, func, text
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import relationship
 
 # --- Database Models ---
@@ -43,6 +67,10 @@ class Region(db.Model):
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
     geom = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=True)) # For spatial data
+    # Simplified copies precomputed by populate_db.py (see GEOMETRY_LODS)
+    geom_lod1 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
+    geom_lod2 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
+    geom_lod3 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
 
     departments = relationship('Department', back_populates='region')
     production_data = relationship('ProductionData', back_populates='region')
@@ -55,6 +83,10 @@ class Department(db.Model):
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
     geom = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=True)) # For spatial data
+    # Simplified copies precomputed by populate_db.py (see GEOMETRY_LODS)
+    geom_lod1 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
+    geom_lod2 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
+    geom_lod3 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
     region_id = Column(Integer, ForeignKey('regions.id'), nullable=False)
 
     region = relationship('Region', back_populates='departments')
@@ -69,6 +101,10 @@ class Commune(db.Model):
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
     geom = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=True)) # For spatial data
+    # Simplified copies precomputed by populate_db.py (see GEOMETRY_LODS)
+    geom_lod1 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
+    geom_lod2 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
+    geom_lod3 = Column(Geometry('MULTIPOLYGON', srid=4326, spatial_index=False))
     department_id = Column(Integer, ForeignKey('departments.id'), nullable=False)
 
     department = relationship('Department', back_populates='communes')
@@ -82,6 +118,7 @@ class ProductionData(db.Model):
     id = Column(Integer, primary_key=True)
     filiere = Column(String, nullable=False)
     product = Column(String, nullable=False)
+    year = Column(Integer, nullable=True)
     tonnes = Column(Float, nullable=False)
 
     region_id = Column(Integer, ForeignKey('regions.id'), nullable=True)
@@ -95,191 +132,2098 @@ class ProductionData(db.Model):
     def __repr__(self):
         return f'<ProductionData {self.filiere} - {self.product} in Region {self.region_id}>'
 
-def build_geojson_response(results):
-    """Aggregate results by zone name and build proper GeoJSON with aggregated properties."""
+class RegionCount(db.Model):
+    __tablename__ = 'region_counts'
+    region_id = Column(Integer, ForeignKey('regions.id'), primary_key=True)
+    dept_count = Column(Integer, nullable=False)
+    commune_count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<RegionCount {self.region_id}: {self.dept_count} depts, {self.commune_count} communes>'
+
+class ProductionRollup(db.Model):
+    """Production pre-aggregated per zone, rebuilt by populate_db.py at load time."""
+    __tablename__ = 'production_rollup'
+    id = Column(Integer, primary_key=True)
+    level = Column(String, nullable=False) # 'regions', 'departments' or 'communes'
+    zone_id = Column(Integer, nullable=False)
+    zone_name = Column(String, nullable=False)
+    region_name = Column(String, nullable=True)
+    filiere = Column(String, nullable=False)
+    product = Column(String, nullable=False)
+    year = Column(Integer, nullable=True) # NULL: all years summed
+    tonnes = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductionRollup {self.level}/{self.zone_name} {self.filiere} - {self.product}>'
+
+class ProductionRanking(db.Model):
+    """Zones ranked by all-years tonnage per (level, filiere, product), built by populate_db.py."""
+    __tablename__ = 'production_ranking'
+    id = Column(Integer, primary_key=True)
+    level = Column(String, nullable=False)
+    filiere = Column(String, nullable=True) # NULL: all filieres summed
+    product = Column(String, nullable=False)
+    rank = Column(Integer, nullable=False) # 1 for the largest producer
+    zone_id = Column(Integer, nullable=False)
+    zone_name = Column(String, nullable=False)
+    region_name = Column(String, nullable=True)
+    tonnes = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductionRanking {self.level} {self.product} #{self.rank}: {self.zone_name}>'
+
+class DataVersion(db.Model):
+    """Single-row stamp rewritten by populate_db.py at the end of every load."""
+    __tablename__ = 'data_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(String, nullable=False)
+    loaded_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<DataVersion {self.version}>'
+
+class ZoneSubdivision(db.Model):
+    """Zone cut into small GIST-indexed pieces (ST_Subdivide) by populate_db.py, for /api/aggregate."""
+    __tablename__ = 'zone_subdivisions'
+    id = Column(Integer, primary_key=True)
+    level = Column(String, nullable=False) # 'departments' or 'communes'
+    zone_id = Column(Integer, nullable=False)
+    zone_area = Column(Float, nullable=False) # area of the whole zone
+    geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326), nullable=False)
+
+    def __repr__(self):
+        return f'<ZoneSubdivision {self.level}/{self.zone_id}>'
+
+# Geometry levels of detail: (column, simplification tolerance in degrees,
+# GeoJSON decimal digits, minimum zoom). Ordered from finest to coarsest.
+GEOMETRY_LODS = (
+    ('geom', 0.0, 6, 11),
+    ('geom_lod1', 0.001, 5, 9),
+    ('geom_lod2', 0.005, 4, 7),
+    ('geom_lod3', 0.02, 3, 0),
+)
+
+def select_lod(zoom=None, tolerance=None):
+    """Index in GEOMETRY_LODS for a map zoom or a max tolerance; full resolution by default."""
+    if tolerance is not None:
+        # Coarsest precomputed level that stays within the requested tolerance
+        for index in range(len(GEOMETRY_LODS) - 1, -1, -1):
+            if GEOMETRY_LODS[index][1] <= tolerance:
+                return index
+        return 0
+    if zoom is not None:
+        for index, (_, _, _, min_zoom) in enumerate(GEOMETRY_LODS):
+            if zoom >= min_zoom:
+                return index
+    return 0
+
+# Zone table backing each API level
+ZONE_MODELS = {
+    'regions': Region,
+    'departments': Department,
+    'communes': Commune,
+}
+
+# --- Instrumentation ---
+# Hot-path phases (db, fetch, aggregate, serialize, compress) are timed per request,
+# returned as a Server-Timing header and accumulated into per-process Prometheus
+# histograms served by /api/metrics.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Histogram:
+    """Thread-safe Prometheus histogram with one series per value of a single label."""
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # [per-bucket counts (+Inf last), count, sum]
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += 1
+            series[2] += value
+
+    def exposition(self):
+        """Lines of the Prometheus text format."""
+        with self._lock:
+            snapshot = [(label_value, list(counts), count, total)
+                        for label_value, (counts, count, total) in self._series.items()]
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_value, counts, count, total in sorted(snapshot):
+            label = f'{self.label}="{escape_label(label_value)}"'
+            for bound, cumulative in zip(self.buckets, itertools.accumulate(counts)):
+                # repr keeps every digit (:g turned 1 MiB into 1.04858e+06), as Prometheus clients do
+                lines.append(f'{self.name}_bucket{{{label},le="{float(bound)!r}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total!r}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+request_duration = Histogram('geoprod_request_duration_seconds',
+                             'Time to produce the response headers, by route.', 'route', DURATION_BUCKETS)
+phase_duration = Histogram('geoprod_phase_duration_seconds',
+                           'Time spent in each hot-path phase.', 'phase', DURATION_BUCKETS)
+response_size = Histogram('geoprod_response_size_bytes',
+                          'Response body size as sent, by route.', 'route', SIZE_BUCKETS)
+
+# DB execution time of the current thread, to tell it apart from row fetching
+_thread_db_time = threading.local()
+
+def record_timing(phase, seconds):
+    """Add `seconds` to a phase histogram and to the current request's Server-Timing."""
+    phase_duration.observe(phase, seconds)
+    if has_request_context():
+        timings = g.get('timings')
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + seconds
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(phase, time.perf_counter() - started)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    _thread_db_time.total = getattr(_thread_db_time, 'total', 0.0) + elapsed
+    record_timing('db', elapsed)
+
+def fetch_all(query):
+    """query.all(), timing row fetching and materialization apart from the DB execution."""
+    db_time = getattr(_thread_db_time, 'total', 0.0)
+    started = time.perf_counter()
+    rows = query.all()
+    elapsed = time.perf_counter() - started
+    record_timing('fetch', elapsed - (getattr(_thread_db_time, 'total', 0.0) - db_time))
+    return rows
+
+# Opt-in sampling profiler: set PROFILE_SLOW_MS to dump the stacks of slower requests
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), 'geoprod-profiles'))
+
+def fold_stack(frame):
+    """Folded stack (root;...;leaf) of a frame, as read by flamegraph.pl and speedscope."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class SamplingProfiler:
+    """
+    Samples the stacks of in-flight request threads every `interval` seconds and
+    writes the folded stacks of requests slower than `threshold` to `output_dir`.
+    """
+
+    def __init__(self, interval, threshold, output_dir):
+        self.interval = interval
+        self.threshold = threshold
+        self.output_dir = output_dir
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start_request(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            # Started lazily so that it runs in the gunicorn worker, not the master
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+                self._thread.start()
+
+    def finish_request(self, name, elapsed):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or elapsed < self.threshold:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = ''.join(c if c.isalnum() else '_' for c in name).strip('_') or 'index'
+        filepath = os.path.join(self.output_dir, f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-'
+                                                 f'{int(elapsed * 1000)}ms-{slug}.folded')
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for stack, samples in stacks.most_common():
+                f.write(f'{stack} {samples}\n')
+        app.logger.warning("Slow request %s (%.0f ms), profile written to %s", name, elapsed * 1000, filepath)
+
+    def _sample(self):
+        own_ident = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own_ident:
+                        stacks[fold_stack(frame)] += 1
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000, PROFILE_SLOW_MS / 1000, PROFILE_DIR) \
+    if PROFILE_SLOW_MS > 0 else None
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timings = {}
+    if profiler is not None:
+        profiler.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    """Server-Timing header and route metrics. Streamed bodies are still being produced here."""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_duration.observe(route, elapsed)
+    if response.content_length is not None:
+        response_size.observe(route, response.content_length)
+
+    entries = [f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in g.timings.items()]
+    cache_status = g.get('cache_status')
+    if cache_status:
+        entries.append(f'cache;desc="{cache_status}"')
+    entries.append(f'total;dur={elapsed * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    # Runs once a streamed body is fully sent, so streaming is profiled too
+    started = g.get('request_started')
+    if profiler is not None and started is not None:
+        profiler.finish_request(request.path, time.perf_counter() - started)
+
+# --- Aggregation engine ---
+try:
+    import orjson
+except ImportError: # optional fast encoder
+    orjson = None
+
+def dumps_json(obj):
+    """Serialize to compact UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class ZoneAggregate:
+    """Production of one zone accumulated in a single pass over the rollup rows."""
+    __slots__ = ('zone_id', 'name', 'region_name', 'filiere_tonnes', 'product_tonnes',
+                 'products_by_filiere', 'total_tonnes', 'dominant_filiere')
+
+    def __init__(self, zone_id, name, region_name):
+        self.zone_id = zone_id
+        self.name = name
+        self.region_name = region_name
+        self.filiere_tonnes = {}
+        self.product_tonnes = {}
+        self.products_by_filiere = {}
+        self.total_tonnes = 0
+        self.dominant_filiere = None
+
+    def properties(self):
+        """Feature properties in the format expected by the map."""
+        filiere_tonnes = self.filiere_tonnes
+        return {
+            'name': self.name,
+            'region_name': self.region_name,
+            'filieres': sorted(filiere_tonnes),
+            'products': sorted(self.product_tonnes),
+            'filiere_tonnes': filiere_tonnes,
+            'product_tonnes': self.product_tonnes,
+            # Products of each filiere by decreasing tonnage
+            'products_by_filiere': {
+                filiere: dict(sorted(products.items(), key=lambda x: x[1], reverse=True))
+                for filiere, products in self.products_by_filiere.items()
+            },
+            'total_tonnes': self.total_tonnes,
+            'dominant_filiere': self.dominant_filiere
+                                or (max(filiere_tonnes, key=filiere_tonnes.get) if filiere_tonnes else None)
+        }
+
+def aggregate_zones(rows):
+    """
+    Aggregate (zone_id, name, region_name, filiere, product, tonnes) rows
+    into {zone_id: ZoneAggregate}, keeping the order in which zones appear.
+    """
     zones = {}
-    
-    for row in results:
-        row_dict = row._asdict()
-        zone_name = row_dict.pop('name')
-        geom_json = json.loads(row_dict.pop('geojson'))
-        filiere = row_dict.get('filiere')
-        product = row_dict.get('product')
-        tonnes = row_dict.get('tonnes', 0)
-        
-        if zone_name not in zones:
-            zones[zone_name] = {
-                'geometry': geom_json,
-                'properties': {
-                    'name': zone_name,
-                    'region_name': row_dict.get('region_name'),
-                    'filieres': set(),
-                    'products': set(),
-                    'filiere_tonnes': {},
-                    'product_tonnes': {},
-                    'products_by_filiere': {},
-                    'total_tonnes': 0
-                }
-            }
-        
+    for zone_id, name, region_name, filiere, product, tonnes in rows:
+        zone = zones.get(zone_id)
+        if zone is None:
+            zone = zones[zone_id] = ZoneAggregate(zone_id, name, region_name)
+        tonnes = tonnes or 0
+
         if filiere:
-            zones[zone_name]['properties']['filieres'].add(filiere)
-            zones[zone_name]['properties']['filiere_tonnes'][filiere] = zones[zone_name]['properties']['filiere_tonnes'].get(filiere, 0) + tonnes
-            
-            if filiere not in zones[zone_name]['properties']['products_by_filiere']:
-                zones[zone_name]['properties']['products_by_filiere'][filiere] = {}
-        
+            zone.filiere_tonnes[filiere] = zone.filiere_tonnes.get(filiere, 0) + tonnes
+            by_filiere = zone.products_by_filiere.get(filiere)
+            if by_filiere is None:
+                by_filiere = zone.products_by_filiere[filiere] = {}
         if product:
-            zones[zone_name]['properties']['products'].add(product)
-            zones[zone_name]['properties']['product_tonnes'][product] = zones[zone_name]['properties']['product_tonnes'].get(product, 0) + tonnes
-            
+            zone.product_tonnes[product] = zone.product_tonnes.get(product, 0) + tonnes
             if filiere:
-                zones[zone_name]['properties']['products_by_filiere'][filiere][product] = zones[zone_name]['properties']['products_by_filiere'][filiere].get(product, 0) + tonnes
-        
-        zones[zone_name]['properties']['total_tonnes'] += tonnes
-    
-    # Convert sets to lists and determine dominant filiere
-    features = []
-    for zone_name, zone_data in zones.items():
-        props = zone_data['properties']
-        props['filieres'] = sorted(list(props['filieres']))
-        props['products'] = sorted(list(props['products']))
-        
-        # Keep products_by_filiere with tonnes information
-        products_by_filiere_with_tonnes = {}
-        for filiere, products_dict in props['products_by_filiere'].items():
-            products_by_filiere_with_tonnes[filiere] = dict(sorted(products_dict.items(), key=lambda x: x[1], reverse=True))
-        props['products_by_filiere'] = products_by_filiere_with_tonnes
-        
-        # Determine dominant filiere
-        if props['filiere_tonnes']:
-            props['dominant_filiere'] = max(props['filiere_tonnes'], key=props['filiere_tonnes'].get)
-        else:
-            props['dominant_filiere'] = None
-        
-        # Keep filiere_tonnes and product_tonnes for frontend display
-        # No deletion - keep the data!
-        
-        features.append({
-            "type": "Feature",
-            "geometry": zone_data['geometry'],
-            "properties": props
-        })
-    
-    return {
-        "type": "FeatureCollection",
-        "features": features
-    }
+                by_filiere[product] = by_filiere.get(product, 0) + tonnes
+
+        zone.total_tonnes += tonnes
+    return zones
+
+def build_geojson_response(rows, geometries):
+    """
+    Serialized GeoJSON FeatureCollection of the aggregated rows.
+    `geometries` maps zone ids to pre-serialized GeoJSON geometry strings,
+    spliced into the output as is rather than parsed and re-encoded.
+    """
+    with timed('aggregate'):
+        zones = aggregate_zones(rows)
+    return serialize_zones(zones, geometries)
+
+def serialize_zones(zones, geometries):
+    """Serialized GeoJSON FeatureCollection of {zone_id: ZoneAggregate}."""
+    with timed('serialize'):
+        features = b','.join(
+            feature_bytes(zone, geometries.get(zone_id))
+            for zone_id, zone in zones.items()
+        )
+        return b'{"type":"FeatureCollection","features":[' + features + b']}'
+
+def feature_bytes(zone, geometry):
+    """One serialized GeoJSON Feature from a ZoneAggregate and its geometry string."""
+    return b''.join((
+        b'{"type":"Feature","geometry":',
+        geometry.encode('utf-8') if geometry else b'null',
+        b',"properties":',
+        dumps_json(zone.properties()),
+        b'}'
+    ))
+
+def build_zone_attributes(zones):
+    """Properties of {zone_id: ZoneAggregate} keyed by zone id, without geometry."""
+    return {str(zone_id): zone.properties() for zone_id, zone in zones.items()}
 
 @app.route('/api')
 def api_home():
-    return '<h1>Geo-production API</h1><p>Use /api/regions, /api/departments, or /api/communes.</p>'
+    return '<h1>Geo-production API</h1><p>Use /api/regions, /api/departments, or /api/communes '\
+           '(optional ?filiere=, ?year= or ?from=&amp;to=, ?zoom= or ?tolerance=), '\
+           'vector tiles at /api/tiles/&lt;level&gt;/{z}/{x}/{y}.pbf, '\
+           '/api/timeseries?zone=&amp;product= for yearly series, '\
+           'POST /api/aggregate with a GeoJSON polygon for area-weighted totals, '\
+           '/api/top?level=&amp;product=&amp;n= for the largest producers, '\
+           'and /api/geometry/&lt;level&gt; + /api/attributes/&lt;level&gt; to fetch polygons once.</p>'
+
+# --- Response cache ---
+# Max number of cached (level, filiere) responses
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "32"))
+# Max number of cached responses to bbox, year and other client-chosen filters, kept
+# apart so that panning the map doesn't evict the default level responses
+FILTERED_CACHE_SIZE = int(os.getenv("FILTERED_CACHE_SIZE", "128"))
+# How long (seconds) the data version read from the DB is trusted before re-checking
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "5"))
+
+_data_version = {'value': None, 'checked_at': 0.0}
+_data_version_lock = threading.Lock()
+
+def read_data_version():
+    """Return the data version written by the loader, re-read at most every DATA_VERSION_TTL seconds."""
+    now = time.monotonic()
+    with _data_version_lock:
+        if _data_version['value'] is not None and now - _data_version['checked_at'] < DATA_VERSION_TTL:
+            return _data_version['value']
+    try:
+        version = db.session.query(DataVersion.version).order_by(DataVersion.id.desc()).limit(1).scalar()
+    except Exception:
+        db.session.rollback()
+        # Keep serving the version already loaded (in memory, in the caches) while the DB is away
+        with _data_version_lock:
+            if _data_version['value'] is not None:
+                return _data_version['value']
+        version = None
+    version = version or 'unversioned'
+    with _data_version_lock:
+        _data_version['value'] = version
+        _data_version['checked_at'] = now
+    return version
+
+class CachedResponse:
+    """Pre-serialized JSON body, its gzipped copy and their strong ETags."""
+    __slots__ = ('body', 'gzipped', 'etag', 'gzip_etag')
+
+    def __init__(self, body):
+        self.body = body
+        with timed('compress'):
+            self.gzipped = gzip.compress(body, compresslevel=6)
+            digest = hashlib.sha1(body).hexdigest()
+        self.etag = digest
+        self.gzip_etag = f'{digest}-gz'
+
+class ResponseCache:
+    """Thread-safe LRU cache of serialized responses, invalidated when the data version changes."""
+
+    def __init__(self, max_entries, name):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, count=True):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+                if count:
+                    self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if count:
+                if entry is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, key, version, entry):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, 'responses')
+filtered_cache = ResponseCache(FILTERED_CACHE_SIZE, 'filtered')
+
+def normalize_filiere(filiere):
+    """None and 'all' both mean no filiere filter."""
+    if not filiere or filiere.lower() == 'all':
+        return None
+    return filiere
+
+# --- Request coalescing ---
+# Concurrent misses on the same key wait for a single computation instead of all
+# running the same queries (e.g. right after a reload). Set SINGLE_FLIGHT_DIR (ideally
+# on tmpfs, like /dev/shm) to also coordinate gunicorn workers through lock files.
+# Only bounded keys (default maps, known filieres) go through the directory.
+SINGLE_FLIGHT_DIR = os.getenv("SINGLE_FLIGHT_DIR")
+# Bodies larger than this aren't handed over through the directory (waiting workers build their own)
+SINGLE_FLIGHT_MAX_BODY_BYTES = int(os.getenv("SINGLE_FLIGHT_MAX_BODY_BYTES", str(16 * 1024 ** 2)))
+# Total size of the directory above which no more bodies are written
+SINGLE_FLIGHT_MAX_BYTES = int(os.getenv("SINGLE_FLIGHT_MAX_BYTES", str(32 * 1024 ** 2)))
+# Files older than this (left by a killed worker) are removed
+SINGLE_FLIGHT_MAX_AGE = 300
+
+try:
+    import fcntl
+except ImportError: # not available on Windows: in-process coalescing only
+    fcntl = None
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers of the same key share its result."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """(result of function(), True if this call ran it rather than waiting for another)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, False
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, True
+
+single_flight = SingleFlight()
+
+def shared_build(cache, key, version, build_body):
+    """
+    `build_body()`, computed by a single gunicorn worker at a time when SINGLE_FLIGHT_DIR
+    is set: the first worker holds a lock file while building and leaves the body next
+    to it, the others wait on the lock and read that body instead of rebuilding it.
+    A body that isn't handed over leaves an `.unshared` marker instead, so the waiting
+    workers build their own in parallel rather than one after another under the lock.
+    Every worker holds a shared lock on a `.readers` file while it takes part; the last
+    one out removes the files, so the directory only holds builds in flight.
+    """
+    if not SINGLE_FLIGHT_DIR or fcntl is None:
+        return build_body()
+    os.makedirs(SINGLE_FLIGHT_DIR, exist_ok=True)
+    digest = hashlib.sha1(repr((cache.name, key)).encode('utf-8')).hexdigest()
+    base = os.path.join(SINGLE_FLIGHT_DIR, f'{version}-{digest}')
+    with open(base + '.readers', 'a') as readers:
+        fcntl.flock(readers, fcntl.LOCK_SH)
+        try:
+            with open(base + '.lock', 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    try:
+                        with open(base + '.body', 'rb') as f:
+                            return f.read()
+                    except FileNotFoundError:
+                        pass
+                    if not os.path.exists(base + '.unshared'):
+                        body = build_body()
+                        if not hand_over(base, version, body):
+                            mark_unshared(base)
+                        return body
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            # The leader's body wasn't handed over: build outside the lock
+            return build_body()
+        finally:
+            fcntl.flock(readers, fcntl.LOCK_UN)
+            release_shared_build(base, readers)
+
+def hand_over(base, version, body):
+    """
+    Write `body` for the waiting workers, unless it would exceed the directory's size caps.
+    Returns whether it was written.
+    """
+    if len(body) > SINGLE_FLIGHT_MAX_BODY_BYTES \
+            or prune_shared_builds(version) + len(body) > SINGLE_FLIGHT_MAX_BYTES:
+        return False
+    staging = f'{base}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(staging, 'wb') as f:
+            f.write(body)
+        os.replace(staging, base + '.body')
+        return True
+    except OSError:
+        # e.g. ENOSPC: the waiting workers build it themselves
+        app.logger.warning("Could not share a build through %s", SINGLE_FLIGHT_DIR, exc_info=True)
+        return False
+    finally:
+        try:
+            os.remove(staging)
+        except OSError:
+            pass
+
+def mark_unshared(base):
+    """Tell the workers waiting on `base` that no body will be handed over."""
+    try:
+        open(base + '.unshared', 'a').close()
+    except OSError:
+        # Without the marker the waiting workers rebuild one at a time, as a fallback
+        app.logger.warning("Could not mark a build as unshared in %s", SINGLE_FLIGHT_DIR, exc_info=True)
+
+def release_shared_build(base, readers):
+    """Remove the files of a build once no other worker takes part in it anymore."""
+    try:
+        fcntl.flock(readers, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return # still read by another worker, which will clean up
+    try:
+        # A worker already blocked on the old files at worst rebuilds the body itself
+        for suffix in ('.body', '.unshared', '.lock', '.readers'):
+            try:
+                os.remove(base + suffix)
+            except OSError:
+                pass
+    finally:
+        fcntl.flock(readers, fcntl.LOCK_UN)
+
+def prune_shared_builds(version):
+    """
+    Remove the files left in SINGLE_FLIGHT_DIR by previous data versions or killed
+    workers. Returns the size of the remaining files.
+    """
+    total = 0
+    now = time.time()
+    for entry in os.scandir(SINGLE_FLIGHT_DIR):
+        try:
+            stat = entry.stat()
+            if not entry.name.startswith(f'{version}-') or now - stat.st_mtime > SINGLE_FLIGHT_MAX_AGE:
+                os.remove(entry.path)
+            else:
+                total += stat.st_size
+        except OSError:
+            pass
+    return total
+
+def shareable(filiere=None, years=None, bbox=None):
+    """
+    Whether a key may be built through SINGLE_FLIGHT_DIR and cached with the default
+    responses: only the finite set of default requests, not keys made of arbitrary
+    client input (those go to filtered_cache).
+    """
+    return (filiere is None or filiere in FILIERES) and years is None and bbox is None
+
+def cached_entry(cache, key, build_body, shared=True):
+    """
+    CachedResponse for `key` in `cache`, built from `build_body()` on a miss.
+    Concurrent misses on the same key are coalesced into one build, across
+    workers too unless `shared` is False (unbounded key spaces).
+    """
+    version = get_data_version()
+    entry = cache.get(key, version)
+    if entry is None:
+        def build():
+            # Filled by a build that finished between our miss and this call
+            entry = cache.get(key, version, count=False)
+            if entry is None:
+                body = shared_build(cache, key, version, build_body) if shared else build_body()
+                entry = CachedResponse(body)
+                cache.put(key, version, entry)
+            return entry
+        entry, leader = single_flight.do((cache.name, version, key), build)
+        status = 'miss' if leader else 'coalesced'
+    else:
+        status = 'hit'
+    if has_request_context():
+        g.cache_status = status
+    return entry
+
+def cached_response(cache, key, build_body, mimetype, shared=True):
+    """
+    Serve the bytes returned by `build_body()` through `cache`.
+    Handles If-None-Match (304) and gzip negotiation from the pre-compressed body.
+    """
+    entry = cached_entry(cache, key, build_body, shared)
+
+    # `in` would also match an explicit gzip;q=0
+    use_gzip = request.accept_encodings['gzip'] > 0
+    etag = entry.gzip_etag if use_gzip else entry.etag
+
+    if request.if_none_match.contains(entry.etag) or request.if_none_match.contains(entry.gzip_etag) \
+            or request.if_none_match.star_tag:
+        response = Response(status=304)
+    elif use_gzip:
+        response = Response(entry.gzipped, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(entry.body, mimetype=mimetype)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def json_body(build):
+    """Body builder serializing `build()` as compact UTF-8 JSON."""
+    def build_body():
+        data = build()
+        with timed('serialize'):
+            return dumps_json(data)
+    return build_body
+
+def cached_json_response(key, build, shared=True):
+    """
+    Serve `build()` serialized as JSON through the response cache, or through
+    filtered_cache for keys that aren't `shared` (unbounded key spaces).
+    """
+    cache = response_cache if shared else filtered_cache
+    return cached_response(cache, key, json_body(build), 'application/json', shared)
+
+def year_range():
+    """(from, to) years requested with ?year= or ?from=&to=, or None for all years summed."""
+    year = request.args.get('year', default=None, type=int)
+    if year is not None:
+        return (year, year)
+    year_from = request.args.get('from', default=None, type=int)
+    year_to = request.args.get('to', default=None, type=int)
+    if year_from is None and year_to is None:
+        return None
+    return (year_from, year_to)
+
+def filter_rollup(query, level, filiere=None, years=None):
+    """Restrict a production_rollup query to a level, filiere and year range."""
+    query = query.filter(ProductionRollup.level == level)
+    if filiere:
+        query = query.filter(ProductionRollup.filiere == filiere)
+    if years is None:
+        return query.filter(ProductionRollup.year.is_(None))
+    query = query.filter(ProductionRollup.year.isnot(None))
+    year_from, year_to = years
+    if year_from is not None:
+        query = query.filter(ProductionRollup.year >= year_from)
+    if year_to is not None:
+        query = query.filter(ProductionRollup.year <= year_to)
+    return query
+
+def bbox_zone_ids(level, bbox):
+    """Subquery of the ids of a level's zones intersecting a (minx, miny, maxx, maxy) box."""
+    zone_model = ZONE_MODELS[level]
+    envelope = func.ST_MakeEnvelope(*bbox, 4326)
+    # && prefilters on the GIST index before the exact intersection test
+    return db.session.query(zone_model.id).filter(
+        zone_model.geom.op('&&')(envelope),
+        func.ST_Intersects(zone_model.geom, envelope)
+    )
+
+def rollup_query(level, filiere=None, years=None, bbox=None):
+    """
+    Query of the pre-aggregated production of a level, as
+    (zone_id, name, region_name, filiere, product, tonnes) rows without geometry.
+    With `bbox`, only zones intersecting the box are kept.
+    """
+    columns = (
+        ProductionRollup.zone_id.label('zone_id'),
+        ProductionRollup.zone_name.label('name'),
+        ProductionRollup.region_name.label('region_name'),
+        ProductionRollup.filiere.label('filiere'),
+        ProductionRollup.product.label('product'),
+    )
+    if years is None:
+        # All-years totals are stored as is: a single indexed lookup
+        query = filter_rollup(db.session.query(*columns, ProductionRollup.tonnes.label('tonnes')), level, filiere)
+    else:
+        # Sum the yearly rows of the range
+        query = filter_rollup(db.session.query(*columns, func.sum(ProductionRollup.tonnes).label('tonnes')),
+                              level, filiere, years).group_by(*columns)
+    if bbox is not None:
+        query = query.filter(ProductionRollup.zone_id.in_(bbox_zone_ids(level, bbox)))
+    return query
+
+def query_rollup(level, filiere=None, years=None, bbox=None):
+    """Rows of rollup_query()."""
+    return fetch_all(rollup_query(level, filiere, years, bbox))
+
+# Serialized geometries of a level, one entry per (level, level of detail) as GeoJSON and as WKB
+geometry_cache = ResponseCache(len(ZONE_MODELS) * len(GEOMETRY_LODS) * 2, 'geometries')
+
+def zone_geometries(level, lod=0):
+    """{zone_id: GeoJSON geometry string} of a level, fetched once per data version."""
+    store = memory_store()
+    if store is not None:
+        return store.levels[level].geometries[lod]
+    key = (level, lod)
+    version = get_data_version()
+    geometries = geometry_cache.get(key, version)
+    if geometries is None:
+        def fetch():
+            cached = geometry_cache.get(key, version, count=False)
+            if cached is not None:
+                return cached
+            zone_model = ZONE_MODELS[level]
+            column, _, decimals, _ = GEOMETRY_LODS[lod]
+            geometries = dict(fetch_all(db.session.query(
+                zone_model.id,
+                func.ST_AsGeoJSON(getattr(zone_model, column), decimals)
+            )))
+            geometry_cache.put(key, version, geometries)
+            return geometries
+        geometries, _ = single_flight.do((geometry_cache.name, version, key), fetch)
+    return geometries
+
+def render_level(level, filiere=None, years=None, lod=0, bbox=None):
+    """Serialized GeoJSON of a level."""
+    return serialize_zones(level_zones(level, filiere, years, bbox), zone_geometries(level, lod))
+
+def level_cache_key(level, filiere=None, years=None, lod=0, bbox=None):
+    return (level, filiere, years, lod, bbox)
+
+def parse_bbox():
+    """(minx, miny, maxx, maxy) of ?bbox=, None if absent. Raises ValueError if malformed."""
+    bbox = request.args.get('bbox', default=None, type=str)
+    if not bbox:
+        return None
+    values = tuple(float(value) for value in bbox.split(','))
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise ValueError('bbox must be minx,miny,maxx,maxy')
+    return values
+
+# --- In-memory serving ---
+# With SERVING_MODE=memory the rollup and geometries of the current data version are
+# loaded once into NumPy arrays, and the level, attribute, export, locate and timeseries
+# endpoints are answered without querying PostgreSQL. The database is only read again
+# to check the data version (every DATA_VERSION_TTL seconds) and to reload on change.
+# Vector tiles and FlatGeobuf are still rendered by PostGIS.
+MEMORY_SERVING = os.getenv("SERVING_MODE", "db").lower() == "memory"
+
+try:
+    import numpy as np
+    import shapely
+except ImportError: # optional, only needed with SERVING_MODE=memory
+    np = shapely = None
+
+if MEMORY_SERVING and (np is None or shapely is None):
+    raise RuntimeError("SERVING_MODE=memory requires numpy and shapely")
+
+class LevelIndex:
+    """Zones of one level and the region each one takes its production from."""
+
+    def __init__(self, ids, names, region_names, parents, divisors):
+        self.ids = ids
+        self.names = names
+        self.region_names = region_names
+        self.parents = np.asarray(parents, dtype=np.intp)
+        self.divisors = np.asarray(divisors, dtype=np.float64)
+        self.positions = {zone_id: position for position, zone_id in enumerate(ids)}
+        # Zone names aren't unique (communes): timeseries sums all the zones of a name
+        self.by_name = {}
+        for position, name in enumerate(names):
+            self.by_name.setdefault(name, []).append(position)
+        self.geometries = {}
+        self.wkb = {}
+        self.shapes = None
+
+class ColumnarStore:
+    """
+    Read-only copy of one data version. Regional production is a dense
+    [year slot, region, filiere, product] cube (slot 0: all years summed);
+    departments and communes take their region's slice divided by the number
+    of zones of the region, as build_production_rollup() does.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self._rankings = {}
+
+    @classmethod
+    def load(cls, version):
+        started = time.perf_counter()
+        store = cls(version)
+        regions = db.session.query(Region.id, Region.name).order_by(Region.id).all()
+        departments = db.session.query(Department.id, Department.name, Department.region_id)\
+            .order_by(Department.id).all()
+        communes = db.session.query(Commune.id, Commune.name, Department.region_id)\
+            .join(Department, Commune.department_id == Department.id)\
+            .order_by(Commune.id).all()
+        rollup = fetch_all(db.session.query(
+            ProductionRollup.zone_id, ProductionRollup.filiere, ProductionRollup.product,
+            ProductionRollup.year, ProductionRollup.tonnes
+        ).filter(ProductionRollup.level == 'regions'))
+
+        region_positions = {region_id: position for position, (region_id, _) in enumerate(regions)}
+        store.filieres = sorted({row[1] for row in rollup})
+        store.products = sorted({row[2] for row in rollup})
+        store.years = np.array(sorted({row[3] for row in rollup if row[3] is not None}), dtype=np.int64)
+        store.filiere_positions = {name: i for i, name in enumerate(store.filieres)}
+        store.product_positions = {name: i for i, name in enumerate(store.products)}
+        year_slots = {year: i + 1 for i, year in enumerate(store.years.tolist())}
+
+        shape = (len(store.years) + 1, len(regions), len(store.filieres), len(store.products))
+        store.tonnes = np.zeros(shape, dtype=np.float64)
+        store.present = np.zeros(shape, dtype=bool)
+        if rollup:
+            cells = tuple(np.array(column, dtype=np.intp) for column in zip(*(
+                (0 if year is None else year_slots[year], region_positions[zone_id],
+                 store.filiere_positions[filiere], store.product_positions[product])
+                for zone_id, filiere, product, year, _ in rollup
+            )))
+            np.add.at(store.tonnes, cells, np.array([row[4] or 0 for row in rollup], dtype=np.float64))
+            store.present[cells] = True
+
+        department_parents = [region_positions[region_id] for _, _, region_id in departments]
+        commune_parents = [region_positions[region_id] for _, _, region_id in communes]
+        dept_counts = np.bincount(department_parents, minlength=len(regions))
+        commune_counts = np.bincount(commune_parents, minlength=len(regions))
+        region_names = [name for _, name in regions]
+        store.levels = {
+            'regions': LevelIndex(
+                [region_id for region_id, _ in regions], region_names, [None] * len(regions),
+                range(len(regions)), np.ones(len(regions))
+            ),
+            'departments': LevelIndex(
+                [row[0] for row in departments], [row[1] for row in departments],
+                [region_names[parent] for parent in department_parents],
+                department_parents, dept_counts[department_parents]
+            ),
+            'communes': LevelIndex(
+                [row[0] for row in communes], [row[1] for row in communes],
+                [region_names[parent] for parent in commune_parents],
+                commune_parents, commune_counts[commune_parents]
+            ),
+        }
+
+        for level, zone_model in ZONE_MODELS.items():
+            index = store.levels[level]
+            for lod, (column, _, decimals, _) in enumerate(GEOMETRY_LODS):
+                geometry = getattr(zone_model, column)
+                rows = fetch_all(db.session.query(
+                    zone_model.id, func.ST_AsGeoJSON(geometry, decimals), func.ST_AsBinary(geometry)
+                ))
+                index.geometries[lod] = {zone_id: geojson for zone_id, geojson, _ in rows}
+                index.wkb[lod] = {zone_id: bytes(wkb) if wkb is not None else None for zone_id, _, wkb in rows}
+            index.shapes = shapely.from_wkb([index.wkb[0].get(zone_id) for zone_id in index.ids])
+
+        app.logger.info("In-memory store of data version %s loaded in %.2fs (%d rollup rows)",
+                        version, time.perf_counter() - started, len(rollup))
+        return store
+
+    def cube(self, filiere=None, years=None):
+        """(tonnes, present, filiere names) summed over the year range, [region, filiere, product]."""
+        if years is None:
+            tonnes, present = self.tonnes[0], self.present[0]
+        else:
+            year_from, year_to = years
+            selected = np.ones(len(self.years), dtype=bool)
+            if year_from is not None:
+                selected &= self.years >= year_from
+            if year_to is not None:
+                selected &= self.years <= year_to
+            slots = np.flatnonzero(selected) + 1
+            tonnes, present = self.tonnes[slots].sum(axis=0), self.present[slots].any(axis=0)
+        if filiere is None:
+            return tonnes, present, self.filieres
+        position = self.filiere_positions.get(filiere)
+        if position is None:
+            return None
+        return tonnes[:, position:position + 1], present[:, position:position + 1], [filiere]
+
+    def zones(self, level, filiere=None, years=None, bbox=None, zone_ids=None):
+        """{zone_id: ZoneAggregate} of a level, with the sums computed on whole arrays."""
+        cube = self.cube(filiere, years)
+        if cube is None:
+            return {}
+        tonnes, present, filieres = cube
+        index = self.levels[level]
+        positions = np.arange(len(index.ids))
+        if zone_ids is not None:
+            positions = np.array([index.positions[z] for z in zone_ids if z in index.positions], dtype=np.intp)
+        if bbox is not None:
+            positions = positions[shapely.intersects(index.shapes[positions], shapely.box(*bbox))]
+
+        zone_present = present[index.parents[positions]]
+        keep = zone_present.any(axis=(1, 2))
+        positions, zone_present = positions[keep], zone_present[keep]
+        # Regional production split evenly between the zones of the region
+        zone_tonnes = tonnes[index.parents[positions]] / index.divisors[positions][:, None, None]
+        filiere_tonnes = zone_tonnes.sum(axis=2)
+        filiere_present = zone_present.any(axis=2)
+        product_tonnes = zone_tonnes.sum(axis=1)
+        product_present = zone_present.any(axis=1)
+        totals = filiere_tonnes.sum(axis=1)
+        dominant = np.where(filiere_present, filiere_tonnes, -np.inf).argmax(axis=1)
+
+        aggregates = []
+        for row, position in enumerate(positions.tolist()):
+            zone = ZoneAggregate(index.ids[position], index.names[position], index.region_names[position])
+            zone.total_tonnes = totals[row].item()
+            zone.dominant_filiere = filieres[dominant[row]]
+            aggregates.append(zone)
+        for row, f in zip(*np.nonzero(filiere_present)):
+            aggregates[row].filiere_tonnes[filieres[f]] = filiere_tonnes[row, f].item()
+            aggregates[row].products_by_filiere[filieres[f]] = {}
+        for row, p in zip(*np.nonzero(product_present)):
+            aggregates[row].product_tonnes[self.products[p]] = product_tonnes[row, p].item()
+        rows, fs, ps = np.nonzero(zone_present)
+        for row, f, p, value in zip(rows.tolist(), fs.tolist(), ps.tolist(), zone_tonnes[rows, fs, ps].tolist()):
+            aggregates[row].products_by_filiere[filieres[f]][self.products[p]] = value
+        return {zone.zone_id: zone for zone in aggregates}
+
+    def locate(self, level, lon, lat):
+        """(id, name) of the zone of a level containing a point, or None."""
+        index = self.levels[level]
+        hits = np.flatnonzero(shapely.intersects(index.shapes, shapely.Point(lon, lat)))
+        if not len(hits):
+            return None
+        return index.ids[hits[0]], index.names[hits[0]]
+
+    def ranking(self, level, product, filiere=None):
+        """(ids, names, region names, tonnes) of a level's zones producing `product`, largest first."""
+        key = (level, product, filiere)
+        ranking = self._rankings.get(key)
+        if ranking is not None:
+            return ranking
+        index = self.levels[level]
+        p = self.product_positions.get(product)
+        f = self.filiere_positions.get(filiere) if filiere is not None else None
+        if p is None or (filiere is not None and f is None):
+            ranking = ([], [], [], [])
+        else:
+            filieres = slice(None) if f is None else slice(f, f + 1)
+            tonnes = self.tonnes[0][index.parents][:, filieres, p].sum(axis=1) / index.divisors
+            present = self.present[0][index.parents][:, filieres, p].any(axis=1)
+            positions = np.flatnonzero(present)
+            # Same order as the loader's ranking: tonnes descending, then zone id
+            ids = np.asarray(index.ids)[positions]
+            order = positions[np.lexsort((ids, -tonnes[positions]))].tolist()
+            ranking = ([index.ids[i] for i in order], [index.names[i] for i in order],
+                       [index.region_names[i] for i in order], tonnes[order].tolist())
+        # Computed at most once per key and store; concurrent duplicates are harmless
+        self._rankings[key] = ranking
+        return ranking
+
+    def area_weights(self, level, geometry):
+        """{zone_id: share of the zone's area inside `geometry`} (GeoJSON string) of a level."""
+        index = self.levels[level]
+        area = shapely.make_valid(shapely.from_geojson(geometry))
+        shapely.prepare(area)
+        positions = np.flatnonzero(shapely.intersects(area, index.shapes))
+        shapes = index.shapes[positions]
+        zone_areas = shapely.area(shapes)
+        weights = shapely.area(shapely.intersection(shapes, area)) / np.where(zone_areas > 0, zone_areas, np.inf)
+        return {index.ids[position]: weight
+                for position, weight in zip(positions.tolist(), weights.tolist()) if weight > 0}
+
+    def timeseries(self, level, zone_name, product=None, filiere=None):
+        """(years, tonnes) of the zones named `zone_name`, summed over the filiere and product filters."""
+        index = self.levels[level]
+        positions = np.array(index.by_name.get(zone_name, []), dtype=np.intp)
+        if not len(positions):
+            return [], []
+        # [year, zone, filiere, product]
+        tonnes = self.tonnes[1:, index.parents[positions]] / index.divisors[positions][None, :, None, None]
+        present = self.present[1:, index.parents[positions]]
+        for axis_positions, name, axis in ((self.filiere_positions, filiere, 2), (self.product_positions, product, 3)):
+            if name is None:
+                continue
+            if name not in axis_positions:
+                return [], []
+            i = axis_positions[name]
+            tonnes, present = tonnes.take([i], axis=axis), present.take([i], axis=axis)
+        has_data = present.any(axis=(1, 2, 3))
+        series = tonnes.sum(axis=(1, 2, 3))
+        return self.years[has_data].tolist(), series[has_data].tolist()
+
+_memory_store = {'store': None}
+# Held while a store loads, by the first request or by the reload thread
+_memory_store_lock = threading.Lock()
+
+def memory_store():
+    """
+    ColumnarStore with SERVING_MODE=memory, else None. Only the first load is waited
+    for: when the data version changes, the previous store keeps being served while
+    the new one loads in a background thread, then it is swapped in.
+    """
+    if not MEMORY_SERVING:
+        return None
+    version = read_data_version()
+    store = _memory_store['store']
+    if store is None:
+        with _memory_store_lock:
+            store = _memory_store['store']
+            if store is None:
+                # Built completely before being swapped in: readers never see a partial store
+                store = _memory_store['store'] = ColumnarStore.load(version)
+        return store
+    if store.version != version and _memory_store_lock.acquire(blocking=False):
+        threading.Thread(target=reload_memory_store, args=(version,), name='memory-reload', daemon=True).start()
+    return store
+
+def reload_memory_store(version):
+    """Load the store of `version` and swap it in (run with _memory_store_lock held, released here)."""
+    try:
+        with app.app_context():
+            try:
+                started = time.perf_counter()
+                _memory_store['store'] = ColumnarStore.load(version)
+                app.logger.info("In-memory store of %s loaded in %.2fs", version, time.perf_counter() - started)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Could not load the in-memory store of %s, will retry", version)
+            finally:
+                db.session.remove()
+    finally:
+        _memory_store_lock.release()
+
+def get_data_version():
+    """
+    Version of the data being served, used in cache keys and payloads: the loader's,
+    except with SERVING_MODE=memory, where it is the version of the store in memory
+    until a newer one has been loaded.
+    """
+    if MEMORY_SERVING and _memory_store['store'] is not None:
+        return memory_store().version
+    return read_data_version()
+
+def level_zones(level, filiere=None, years=None, bbox=None):
+    """{zone_id: ZoneAggregate} of a level, from the in-memory store or the rollup table."""
+    store = memory_store()
+    if store is not None:
+        with timed('aggregate'):
+            return store.zones(level, filiere, years, bbox)
+    rows = query_rollup(level, filiere, years, bbox)
+    with timed('aggregate'):
+        return aggregate_zones(rows)
+
+# --- Streaming ---
+# Rows fetched per round trip from the server-side cursor
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+def stream_level_features(level, filiere=None, years=None, lod=0, bbox=None):
+    """
+    Yield (ZoneAggregate, geometry string) zone by zone from a server-side cursor.
+    Rows are ordered by zone and the geometry is only serialized on the first
+    row of each zone, so memory stays bounded by one zone at a time.
+    With SERVING_MODE=memory, zones come from the in-memory store instead.
+    """
+    store = memory_store()
+    if store is not None:
+        geometries = store.levels[level].geometries[lod]
+        for zone_id, zone in store.zones(level, filiere, years, bbox).items():
+            yield zone, geometries.get(zone_id)
+        return
+    zone_model = ZONE_MODELS[level]
+    column, _, decimals, _ = GEOMETRY_LODS[lod]
+    rows = rollup_query(level, filiere, years, bbox).subquery()
+    first_of_zone = func.row_number().over(partition_by=rows.c.zone_id) == 1
+    geojson = case((first_of_zone, func.ST_AsGeoJSON(getattr(zone_model, column), decimals)), else_=None)
 
-@app.route('/api/regions')
-def get_regions():
-    filiere = request.args.get('filiere', default=None, type=str)
-    
     query = db.session.query(
-        Region.name.label('name'),
-        ProductionData.filiere.label('filiere'),
-        ProductionData.product.label('product'),
-        func.sum(ProductionData.tonnes).label('tonnes'),
-        func.ST_AsGeoJSON(Region.geom).label('geojson')
-    ).join(ProductionData, Region.id == ProductionData.region_id)\
-     .filter(ProductionData.department_id.is_(None), ProductionData.commune_id.is_(None))
+        rows.c.zone_id, rows.c.name, rows.c.region_name, rows.c.filiere, rows.c.product, rows.c.tonnes, geojson
+    ).join(zone_model, zone_model.id == rows.c.zone_id)\
+     .order_by(rows.c.zone_id)\
+     .yield_per(STREAM_BATCH_SIZE)
 
-    if filiere and filiere.lower() != 'all':
-        query = query.filter(ProductionData.filiere == filiere)
+    for zone_id, zone_rows in itertools.groupby(query, key=lambda row: row[0]):
+        zone_rows = list(zone_rows)
+        # Rows of a zone come in no particular order: the geometry is on any one of them
+        geometry = next((row[6] for row in zone_rows if row[6] is not None), None)
+        zone = aggregate_zones(row[:6] for row in zone_rows)[zone_id]
+        yield zone, geometry
 
-    results = query.group_by(Region.name, ProductionData.filiere, ProductionData.product, Region.geom).all()
-    return jsonify(build_geojson_response(results))
+def streamed_level_response(level, filiere, years, lod, bbox=None, ndjson=False):
+    """
+    Chunked response emitting features as they are read. With `ndjson`, one
+    Feature per line (newline-delimited GeoJSON) instead of a FeatureCollection.
+    """
+    def generate():
+        if ndjson:
+            for zone, geometry in stream_level_features(level, filiere, years, lod, bbox):
+                yield feature_bytes(zone, geometry) + b'\n'
+            return
+        yield b'{"type":"FeatureCollection","features":['
+        for index, (zone, geometry) in enumerate(stream_level_features(level, filiere, years, lod, bbox)):
+            yield (b',' if index else b'') + feature_bytes(zone, geometry)
+        yield b']}'
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the whole response
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def level_response(level):
+    """
+    Cached GeoJSON response of a level for the request's filiere, years, bbox and zoom/tolerance.
+    ?stream=1 streams it from a server-side cursor instead; ?format=ndjson streams
+    newline-delimited features. Other formats are negotiated with ?format= or Accept.
+    """
+    output_format = requested_format()
+    if output_format is None:
+        return jsonify({'error': f"Unknown format, use one of: {', '.join(list(FORMAT_MIMETYPES) + ['ndjson'])}"}), 400
+    if not format_available(output_format):
+        return jsonify({'error': f'The {output_format} format requires pyarrow on the server'}), 501
+    filiere = normalize_filiere(request.args.get('filiere', default=None, type=str))
+    years = year_range()
+    try:
+        bbox = parse_bbox()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid bbox: {e}'}), 400
+    lod = select_lod(
+        zoom=request.args.get('zoom', default=None, type=int),
+        tolerance=request.args.get('tolerance', default=None, type=float)
+    )
+    ndjson = output_format == 'ndjson'
+    if ndjson or (output_format == 'geojson'
+                  and request.args.get('stream', default='').lower() in ('1', 'true', 'yes')):
+        return streamed_level_response(level, filiere, years, lod, bbox, ndjson)
+    shared = shareable(filiere, years, bbox)
+    if output_format == 'geojson':
+        response = cached_response(
+            response_cache if shared else filtered_cache, level_cache_key(level, filiere, years, lod, bbox),
+            lambda: render_level(level, filiere, years, lod, bbox),
+            'application/json', shared
+        )
+    else:
+        response = cached_response(
+            export_cache if shared else filtered_cache,
+            export_cache_key(output_format, level, filiere, years, lod, bbox),
+            lambda: render_export(output_format, level, filiere, years, lod, bbox),
+            FORMAT_MIMETYPES[output_format], shared
+        )
+    response.vary.add('Accept')
+    return response
+
+@app.route('/api/regions')
+def get_regions():
+    return level_response('regions')
 
 @app.route('/api/departments')
 def get_departments():
-    filiere = request.args.get('filiere', default=None, type=str)
-    
-    # Count departments per region
-    dept_count_subquery = db.session.query(
-        Region.id.label('region_id'),
-        func.count(Department.id).label('dept_count')
-    ).join(Department, Region.id == Department.region_id)\
-     .group_by(Region.id).subquery()
-    
-    # Join department geometries with production data from their region, divided by dept count
-    query = db.session.query(
-        Department.name.label('name'),
-        Region.name.label('region_name'),
-        ProductionData.filiere.label('filiere'),
-        ProductionData.product.label('product'),
-        (func.sum(ProductionData.tonnes) / dept_count_subquery.c.dept_count).label('tonnes'),
-        func.ST_AsGeoJSON(Department.geom).label('geojson')
-    ).join(Region, Department.region_id == Region.id)\
-     .join(dept_count_subquery, Region.id == dept_count_subquery.c.region_id)\
-     .join(ProductionData, Region.id == ProductionData.region_id)\
-     .filter(ProductionData.department_id.is_(None), ProductionData.commune_id.is_(None))
-
-    if filiere and filiere.lower() != 'all':
-        query = query.filter(ProductionData.filiere == filiere)
-
-    results = query.group_by(Department.name, Region.name, ProductionData.filiere, ProductionData.product, Department.geom, dept_count_subquery.c.dept_count).all()
-    return jsonify(build_geojson_response(results))
+    # Region production is already divided by the department count in the rollup
+    return level_response('departments')
 
 @app.route('/api/communes')
 def get_communes():
-    filiere = request.args.get('filiere', default=None, type=str)
-    
-    # Count communes per region
-    commune_count_subquery = db.session.query(
-        Region.id.label('region_id'),
-        func.count(Commune.id).label('commune_count')
-    ).join(Department, Region.id == Department.region_id)\
-     .join(Commune, Department.id == Commune.department_id)\
-     .group_by(Region.id).subquery()
-    
-    # Join commune geometries with production data from their region, divided by commune count
-    query = db.session.query(
-        Commune.name.label('name'),
-        Region.name.label('region_name'),
-        ProductionData.filiere.label('filiere'),
-        ProductionData.product.label('product'),
-        (func.sum(ProductionData.tonnes) / commune_count_subquery.c.commune_count).label('tonnes'),
-        func.ST_AsGeoJSON(Commune.geom).label('geojson')
-    ).join(Department, Commune.department_id == Department.id)\
-     .join(Region, Department.region_id == Region.id)\
-     .join(commune_count_subquery, Region.id == commune_count_subquery.c.region_id)\
-     .join(ProductionData, Region.id == ProductionData.region_id)\
-     .filter(ProductionData.department_id.is_(None), ProductionData.commune_id.is_(None))
-
-    if filiere and filiere.lower() != 'all':
-        query = query.filter(ProductionData.filiere == filiere)
-
-    results = query.group_by(Commune.name, Region.name, ProductionData.filiere, ProductionData.product, Commune.geom, commune_count_subquery.c.commune_count).all()
-    return jsonify(build_geojson_response(results))
+    # Region production is already divided by the commune count in the rollup
+    return level_response('communes')
+
+# --- Geometry and attribute endpoints ---
+# Geometry only changes with the data version: clients fetch it once per version
+# (?v=<data_version>) and only refetch the small attribute payloads afterwards.
+
+def build_geometry_collection(level, lod):
+    """Serialized FeatureCollection of a level's zones with id and name only."""
+    zone_model = ZONE_MODELS[level]
+    geometries = zone_geometries(level, lod)
+    store = memory_store()
+    if store is not None:
+        names = sorted(zip(store.levels[level].ids, store.levels[level].names))
+    else:
+        names = fetch_all(db.session.query(zone_model.id, zone_model.name).order_by(zone_model.id))
+    parts = [b'{"type":"FeatureCollection","data_version":', dumps_json(get_data_version()), b',"features":[']
+    for index, (zone_id, name) in enumerate(names):
+        geometry = geometries.get(zone_id)
+        if index:
+            parts.append(b',')
+        parts.append(b'{"type":"Feature","id":%d,"geometry":' % zone_id)
+        parts.append(geometry.encode('utf-8') if geometry else b'null')
+        parts.append(b',"properties":')
+        parts.append(dumps_json({"name": name}))
+        parts.append(b'}')
+    parts.append(b']}')
+    return b''.join(parts)
+
+@app.route('/api/geometry/<level>')
+def get_geometry(level):
+    if level not in ZONE_MODELS:
+        return jsonify({'error': f'Unknown level {level}'}), 404
+    lod = select_lod(
+        zoom=request.args.get('zoom', default=None, type=int),
+        tolerance=request.args.get('tolerance', default=None, type=float)
+    )
+    response = cached_response(
+        response_cache, ('geometry', level, lod),
+        lambda: build_geometry_collection(level, lod),
+        'application/json'
+    )
+    # A URL pinned to the current data version never changes
+    if request.args.get('v') == get_data_version():
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def parse_filieres():
+    """Filieres of ?filieres=A,B (batched) or ?filiere=A; [None] for all filieres."""
+    filieres = request.args.get('filieres', default=None, type=str)
+    if filieres:
+        return list(dict.fromkeys(normalize_filiere(f.strip()) for f in filieres.split(',') if f.strip()))
+    return [normalize_filiere(request.args.get('filiere', default=None, type=str))]
+
+def build_attributes(level, filieres, years=None, batched=False):
+    """Attribute payload of a level: one zone map, or one per filiere when `batched`."""
+    attributes = {
+        filiere or 'all': build_zone_attributes(level_zones(level, filiere, years))
+        for filiere in filieres
+    }
+    if batched:
+        return {'data_version': get_data_version(), 'filieres': attributes}
+    return {'data_version': get_data_version(), 'zones': next(iter(attributes.values()))}
+
+@app.route('/api/attributes/<level>')
+def get_attributes(level):
+    """
+    Aggregated zone properties keyed by zone id, without geometry.
+    ?filieres=A,B returns one attribute map per filiere in a single response.
+    """
+    if level not in ZONE_MODELS:
+        return jsonify({'error': f'Unknown level {level}'}), 404
+    filieres = parse_filieres()
+    years = year_range()
+    batched = request.args.get('filieres') is not None
+    return cached_json_response(
+        ('attributes', level, tuple(filieres), years, batched),
+        lambda: build_attributes(level, filieres, years, batched),
+        shared=not batched and shareable(filieres[0], years)
+    )
+
+# --- Vector tiles ---
+# Filieres exposed as per-filiere tonnage tile properties
+FILIERES = ('Agriculture', 'Élevage', 'Pêche')
+# Max number of cached tiles
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "4096"))
+MAX_TILE_ZOOM = 22
+
+tile_cache = ResponseCache(TILE_CACHE_SIZE, 'tiles')
+
+def production_summary_sql(level, filiere=None, years=None):
+    """
+    SQL of the `by_filiere` and `production` CTEs summarizing each zone of a level
+    (total_tonnes, dominant_filiere, "tonnes_<filiere>"), with their parameters.
+    """
+    filiere_filter = 'AND filiere = :filiere' if filiere else ''
+    if years is None:
+        year_filter = 'year IS NULL'
+    else:
+        year_filter = 'year IS NOT NULL AND (:year_from IS NULL OR year >= :year_from)' \
+                      ' AND (:year_to IS NULL OR year <= :year_to)'
+    filiere_columns = ',\n'.join(
+        f'COALESCE(SUM(t) FILTER (WHERE filiere = :filiere_{i}), 0) AS "tonnes_{name}"'
+        for i, name in enumerate(FILIERES)
+    )
+    year_from, year_to = years or (None, None)
+    params = {'level': level, 'filiere': filiere, 'year_from': year_from, 'year_to': year_to}
+    params.update({f'filiere_{i}': name for i, name in enumerate(FILIERES)})
+    sql = f'''
+        by_filiere AS (
+            SELECT zone_id, filiere, SUM(tonnes) AS t
+            FROM production_rollup
+            WHERE level = :level AND {year_filter} {filiere_filter}
+            GROUP BY zone_id, filiere
+        ),
+        production AS (
+            SELECT zone_id,
+                   SUM(t) AS total_tonnes,
+                   (array_agg(filiere ORDER BY t DESC))[1] AS dominant_filiere,
+                   {filiere_columns}
+            FROM by_filiere
+            GROUP BY zone_id
+        )'''
+    return sql, params
+
+def render_tile(level, z, x, y, filiere=None):
+    """Render one Mapbox Vector Tile of a level with ST_AsMVT, production joined as properties."""
+    table = ZONE_MODELS[level].__tablename__
+    column = GEOMETRY_LODS[select_lod(zoom=z)][0]
+    production_sql, params = production_summary_sql(level, filiere)
+    filiere_properties = ', '.join(f'p."tonnes_{name}"' for name in FILIERES)
+    params.update({'z': z, 'x': x, 'y': y, 'layer': level})
+
+    sql = text(f'''
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(:z, :x, :y) AS geom_3857,
+                   ST_Transform(ST_TileEnvelope(:z, :x, :y), 4326) AS geom_4326
+        ),{production_sql},
+        features AS (
+            SELECT zone.id, zone.name, p.total_tonnes, p.dominant_filiere, {filiere_properties},
+                   ST_AsMVTGeom(ST_Transform(zone.{column}, 3857), b.geom_3857) AS geom
+            FROM {table} zone
+            JOIN production p ON p.zone_id = zone.id
+            CROSS JOIN bounds b
+            WHERE zone.geom && b.geom_4326
+        )
+        SELECT ST_AsMVT(features.*, :layer, 4096, 'geom', 'id') FROM features
+    ''')
+    return bytes(db.session.execute(sql, params).scalar() or b'')
+
+@app.route('/api/tiles/<level>/<int:z>/<int:x>/<int:y>.pbf')
+def get_tile(level, z, x, y):
+    if level not in ZONE_MODELS or z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({'error': 'Tile not found'}), 404
+    filiere = normalize_filiere(request.args.get('filiere', default=None, type=str))
+    return cached_response(
+        tile_cache, (level, filiere, z, x, y),
+        lambda: render_tile(level, z, x, y, filiere),
+        'application/vnd.mapbox-vector-tile', shared=False
+    )
+
+# --- Output formats ---
+# Compact alternatives to GeoJSON for /api/<level>, chosen with ?format= or the Accept
+# header. They are built on first request and cached per data version; concurrent
+# first requests, across workers too, share a single build (see cached_entry()).
+FORMAT_MIMETYPES = {
+    'geojson': 'application/json',
+    'topojson': 'application/topo+json',
+    'flatgeobuf': 'application/flatgeobuf',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+FORMAT_ALIASES = {'json': 'geojson', 'fgb': 'flatgeobuf', 'geoparquet': 'parquet'}
+# Accept header values, in order of preference when the client accepts anything
+ACCEPTED_MIMETYPES = dict(
+    [(mimetype, name) for name, mimetype in FORMAT_MIMETYPES.items()] + [('application/geo+json', 'geojson')]
+)
+# Quantization grid of TopoJSON coordinates (1e5 is ~10 m across Cameroon)
+TOPOJSON_QUANTIZATION = int(os.getenv("TOPOJSON_QUANTIZATION", "100000"))
+# Formats precomputed for every level and filiere by warm_up(). Opt-in: every worker
+# (and every restarted one) would build them all, TopoJSON of the communes included
+PRECOMPUTED_FORMATS = [name for name in os.getenv("PRECOMPUTED_FORMATS", "").split(',')
+                       if name in FORMAT_MIMETYPES and name != 'geojson']
+EXPORT_CACHE_SIZE = int(os.getenv("EXPORT_CACHE_SIZE", str(len(ZONE_MODELS) * (len(FILIERES) + 1) * 4)))
+
+export_cache = ResponseCache(EXPORT_CACHE_SIZE, 'exports')
+
+def requested_format():
+    """Output format of ?format=, else negotiated from Accept (GeoJSON by default); None if unknown."""
+    name = request.args.get('format', default=None, type=str)
+    if name:
+        name = FORMAT_ALIASES.get(name.lower(), name.lower())
+        return name if name in FORMAT_MIMETYPES or name == 'ndjson' else None
+    mimetype = request.accept_mimetypes.best_match(list(ACCEPTED_MIMETYPES), default='application/json')
+    return ACCEPTED_MIMETYPES[mimetype]
+
+def format_available(name):
+    """Arrow and Parquet need the optional pyarrow package."""
+    return name not in ('arrow', 'parquet') or formats.pa is not None
+
+def zone_wkb(level, lod=0):
+    """{zone_id: WKB bytes} of a level, fetched once per data version."""
+    store = memory_store()
+    if store is not None:
+        return store.levels[level].wkb[lod]
+    key = (level, lod, 'wkb')
+    version = get_data_version()
+    geometries = geometry_cache.get(key, version)
+    if geometries is None:
+        def fetch():
+            cached = geometry_cache.get(key, version, count=False)
+            if cached is not None:
+                return cached
+            zone_model = ZONE_MODELS[level]
+            column = GEOMETRY_LODS[lod][0]
+            geometries = {
+                zone_id: bytes(wkb) if wkb is not None else None
+                for zone_id, wkb in fetch_all(db.session.query(
+                    zone_model.id, func.ST_AsBinary(getattr(zone_model, column))
+                ))
+            }
+            geometry_cache.put(key, version, geometries)
+            return geometries
+        geometries, _ = single_flight.do((geometry_cache.name, version, key), fetch)
+    return geometries
+
+def render_flatgeobuf(level, filiere=None, years=None, lod=0, bbox=None):
+    """FlatGeobuf of a level with its packed R-tree index, written by ST_AsFlatGeobuf."""
+    table = ZONE_MODELS[level].__tablename__
+    column = GEOMETRY_LODS[lod][0]
+    production_sql, params = production_summary_sql(level, filiere, years)
+    filiere_properties = ', '.join(f'p."tonnes_{name}"' for name in FILIERES)
+    bbox_filter = ''
+    if bbox is not None:
+        bbox_filter = 'WHERE zone.geom && ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326)' \
+                      ' AND ST_Intersects(zone.geom, ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326))'
+        params.update(zip(('minx', 'miny', 'maxx', 'maxy'), bbox))
+
+    sql = text(f'''
+        WITH {production_sql.strip()},
+        features AS (
+            SELECT zone.id, zone.name, p.total_tonnes, p.dominant_filiere, {filiere_properties},
+                   zone.{column} AS geom
+            FROM {table} zone
+            JOIN production p ON p.zone_id = zone.id
+            {bbox_filter}
+            ORDER BY zone.id
+        )
+        SELECT ST_AsFlatGeobuf(features.*, true, 'geom') FROM features
+    ''')
+    return bytes(db.session.execute(sql, params).scalar() or b'')
+
+def render_export(name, level, filiere=None, years=None, lod=0, bbox=None):
+    """Body of a level in one of the non-GeoJSON FORMAT_MIMETYPES."""
+    if name == 'flatgeobuf':
+        return render_flatgeobuf(level, filiere, years, lod, bbox)
+    zones = level_zones(level, filiere, years, bbox)
+    if name == 'topojson':
+        geometries = zone_geometries(level, lod)
+        features = (
+            (zone_id, json.loads(geometries[zone_id]) if geometries.get(zone_id) else None, zone.properties())
+            for zone_id, zone in zones.items()
+        )
+        with timed('serialize'):
+            return dumps_json(formats.build_topology(level, features, TOPOJSON_QUANTIZATION))
+    table = formats.zone_table(zones, zone_wkb(level, lod), FILIERES)
+    with timed('serialize'):
+        if name == 'arrow':
+            return formats.arrow_ipc_bytes(table)
+        return formats.geoparquet_bytes(table)
+
+def export_cache_key(name, level, filiere=None, years=None, lod=0, bbox=None):
+    return (name,) + level_cache_key(level, filiere, years, lod, bbox)
+
+def precompute_exports():
+    """Build the PRECOMPUTED_FORMATS of every level and filiere for the current data version."""
+    for name in PRECOMPUTED_FORMATS:
+        if not format_available(name):
+            continue
+        try:
+            for level in ZONE_MODELS:
+                for filiere in (None,) + FILIERES:
+                    cached_entry(
+                        export_cache, export_cache_key(name, level, filiere),
+                        lambda: render_export(name, level, filiere)
+                    )
+        except Exception:
+            # Exports are optional: the GeoJSON map keeps working without them
+            db.session.rollback()
+            app.logger.exception("Could not precompute the %s exports", name)
+
+# --- Point lookup ---
+
+def locate_zone(level, lon, lat):
+    """(id, name) of the zone of a level containing a point, or None."""
+    zone_model = ZONE_MODELS[level]
+    point = func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326)
+    return db.session.query(zone_model.id, zone_model.name)\
+        .filter(func.ST_Intersects(zone_model.geom, point))\
+        .limit(1).first()
+
+@app.route('/api/locate')
+def get_locate():
+    """Region, department and commune containing ?lon=&lat=, with their production summary."""
+    lon = request.args.get('lon', default=None, type=float)
+    lat = request.args.get('lat', default=None, type=float)
+    if lon is None or lat is None:
+        return jsonify({'error': 'Missing or invalid lon/lat parameters'}), 400
+    filiere = normalize_filiere(request.args.get('filiere', default=None, type=str))
+    years = year_range()
+
+    store = memory_store()
+    result = {'lon': lon, 'lat': lat}
+    for level in ZONE_MODELS:
+        zone = store.locate(level, lon, lat) if store is not None else locate_zone(level, lon, lat)
+        if zone is None:
+            result[level] = None
+            continue
+        zone_id, name = zone
+        if store is not None:
+            aggregate = store.zones(level, filiere, years, zone_ids=[zone_id]).get(zone_id)
+        else:
+            rows = rollup_query(level, filiere, years).filter(ProductionRollup.zone_id == zone_id).all()
+            aggregate = aggregate_zones(rows).get(zone_id)
+        result[level] = {
+            'id': zone_id,
+            'name': name,
+            'production': aggregate.properties() if aggregate else None
+        }
+    return Response(dumps_json(result), mimetype='application/json')
+
+@app.route('/api/timeseries')
+def get_timeseries():
+    """Yearly production of one zone as columnar arrays (years[], tonnes[])."""
+    zone = request.args.get('zone', default=None, type=str)
+    if not zone:
+        return jsonify({'error': 'Missing zone parameter'}), 400
+    level = request.args.get('level', default='regions', type=str)
+    if level not in ZONE_MODELS:
+        return jsonify({'error': f'Unknown level {level}'}), 400
+    product = request.args.get('product', default=None, type=str)
+    filiere = normalize_filiere(request.args.get('filiere', default=None, type=str))
+
+    def build():
+        store = memory_store()
+        if store is not None:
+            years, tonnes = store.timeseries(level, zone, product, filiere)
+            return {
+                'level': level,
+                'zone': zone,
+                'product': product,
+                'filiere': filiere,
+                'years': years,
+                'tonnes': tonnes
+            }
+        query = filter_rollup(db.session.query(
+            ProductionRollup.year,
+            func.sum(ProductionRollup.tonnes)
+        ), level, filiere, years=(None, None)).filter(ProductionRollup.zone_name == zone)
+        if product:
+            query = query.filter(ProductionRollup.product == product)
+        rows = query.group_by(ProductionRollup.year).order_by(ProductionRollup.year).all()
+        return {
+            'level': level,
+            'zone': zone,
+            'product': product,
+            'filiere': filiere,
+            'years': [year for year, _ in rows],
+            'tonnes': [tonnes for _, tonnes in rows]
+        }
+
+    return cached_json_response(('timeseries', level, zone, product, filiere), build, shared=False)
+
+# --- Area aggregation ---
+# Production inside an arbitrary polygon: each zone contributes its tonnage times the
+# share of its area covered by the polygon (production assumed uniform within a zone).
+AGGREGATE_LEVELS = ('departments', 'communes')
+AGGREGATE_CACHE_SIZE = int(os.getenv("AGGREGATE_CACHE_SIZE", "256"))
+# Largest polygon accepted, in vertices
+AGGREGATE_MAX_VERTICES = int(os.getenv("AGGREGATE_MAX_VERTICES", "100000"))
+
+aggregate_cache = ResponseCache(AGGREGATE_CACHE_SIZE, 'aggregate')
+
+def is_position(position):
+    return isinstance(position, list) and len(position) >= 2 \
+        and all(isinstance(c, (int, float)) and not isinstance(c, bool) for c in position[:2])
+
+def area_geometry(payload):
+    """
+    GeoJSON Polygon or MultiPolygon dict of a posted geometry, Feature or FeatureCollection
+    (merged into one MultiPolygon). Raises ValueError if it isn't a valid polygonal area.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('expected a GeoJSON object')
+    if payload.get('type') == 'FeatureCollection':
+        geometries = [feature.get('geometry') for feature in payload.get('features') or []
+                      if isinstance(feature, dict)]
+    elif payload.get('type') == 'Feature':
+        geometries = [payload.get('geometry')]
+    else:
+        geometries = [payload]
+
+    polygons = []
+    for geometry in geometries:
+        if not isinstance(geometry, dict) or geometry.get('type') not in ('Polygon', 'MultiPolygon') \
+                or not isinstance(geometry.get('coordinates'), list):
+            raise ValueError('only Polygon and MultiPolygon geometries are supported')
+        polygons.extend(formats.polygons_of(geometry))
+    if not polygons:
+        raise ValueError('no polygon given')
+
+    vertices = 0
+    for polygon in polygons:
+        if not isinstance(polygon, list) or not polygon:
+            raise ValueError('a polygon needs at least an exterior ring')
+        for ring in polygon:
+            if not isinstance(ring, list) or len(ring) < 4 or not all(is_position(p) for p in ring):
+                raise ValueError('rings must be lists of at least 4 [lon, lat] positions')
+            if ring[0] != ring[-1]:
+                raise ValueError('rings must be closed (last position equal to the first)')
+            vertices += len(ring)
+    if vertices > AGGREGATE_MAX_VERTICES:
+        raise ValueError(f'too many vertices ({vertices} > {AGGREGATE_MAX_VERTICES})')
+    if len(polygons) == 1:
+        return {'type': 'Polygon', 'coordinates': polygons[0]}
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+def area_weights(level, geometry):
+    """{zone_id: share of the zone's area inside `geometry`} (GeoJSON string), from zone_subdivisions."""
+    area = db.session.query(
+        func.ST_CollectionExtract(func.ST_MakeValid(
+            func.ST_SetSRID(func.ST_GeomFromGeoJSON(geometry), 4326)
+        ), 3).label('geom')
+    ).cte('area')
+    # Pieces inside the polygon count whole: only the ones crossing its boundary are clipped
+    covered = func.ST_Area(case(
+        (func.ST_CoveredBy(ZoneSubdivision.geom, area.c.geom), ZoneSubdivision.geom),
+        else_=func.ST_Intersection(ZoneSubdivision.geom, area.c.geom)
+    ))
+    rows = fetch_all(
+        db.session.query(ZoneSubdivision.zone_id, func.sum(covered) / func.max(ZoneSubdivision.zone_area))
+        .join(area, ZoneSubdivision.geom.op('&&')(area.c.geom))
+        .filter(ZoneSubdivision.level == level, func.ST_Intersects(ZoneSubdivision.geom, area.c.geom))
+        .group_by(ZoneSubdivision.zone_id)
+    )
+    return {zone_id: weight for zone_id, weight in rows if weight}
+
+def aggregate_area(level, geometry, filiere=None, years=None):
+    """
+    Area-weighted production of a level's zones inside `geometry` (GeoJSON string).
+    Raises ValueError if GEOS or PostGIS can't parse the geometry.
+    """
+    store = memory_store()
+    if store is not None:
+        try:
+            weights = store.area_weights(level, geometry)
+        except shapely.errors.GEOSException as e:
+            raise ValueError(str(e)) from e
+        zones = store.zones(level, filiere, years, zone_ids=list(weights))
+    else:
+        try:
+            weights = area_weights(level, geometry)
+        except DBAPIError as e:
+            db.session.rollback()
+            raise ValueError(str(e.orig).strip().splitlines()[0]) from e
+        zones = {}
+        if weights:
+            rows = fetch_all(rollup_query(level, filiere, years).filter(ProductionRollup.zone_id.in_(list(weights))))
+            with timed('aggregate'):
+                zones = aggregate_zones(rows)
+
+    with timed('aggregate'):
+        total = aggregate_zones(
+            (None, None, None, zone_filiere, product, tonnes * weights[zone_id])
+            for zone_id, zone in zones.items()
+            for zone_filiere, products in zone.products_by_filiere.items()
+            for product, tonnes in products.items()
+        ).get(None) or ZoneAggregate(None, None, None)
+        production = total.properties()
+        del production['name'], production['region_name']
+        return {
+            'level': level,
+            'data_version': get_data_version(),
+            'zones': [
+                {'id': zone_id, 'name': zone.name, 'share': weights[zone_id]}
+                for zone_id, zone in sorted(zones.items(), key=lambda item: -weights[item[0]])
+            ],
+            **production
+        }
+
+@app.route('/api/aggregate', methods=['POST'])
+def post_aggregate():
+    """
+    Area-weighted production inside a posted GeoJSON polygon, computed from
+    ?level=communes (default) or departments. Results are cached by geometry hash.
+    """
+    level = request.args.get('level', default='communes', type=str)
+    if level not in AGGREGATE_LEVELS:
+        return jsonify({'error': f"Unknown level {level}, use one of: {', '.join(AGGREGATE_LEVELS)}"}), 400
+    try:
+        geometry = area_geometry(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid area: {e}'}), 400
+    filiere = normalize_filiere(request.args.get('filiere', default=None, type=str))
+    years = year_range()
+
+    # Same polygon, same key, whatever the formatting of the request body
+    geometry = json.dumps(geometry, separators=(',', ':'))
+    digest = hashlib.sha256(geometry.encode('utf-8')).hexdigest()
+    try:
+        return cached_response(
+            aggregate_cache, (digest, level, filiere, years),
+            json_body(lambda: aggregate_area(level, geometry, filiere, years)),
+            'application/json', shared=False
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid area: {e}'}), 400
+
+# --- Rankings ---
+# Top producers per product, paginated, read by rank from the production_ranking index
+RANKING_CACHE_SIZE = int(os.getenv("RANKING_CACHE_SIZE", "256"))
+RANKING_MAX_N = 100
+
+ranking_cache = ResponseCache(RANKING_CACHE_SIZE, 'ranking')
+
+def ranked_zones(level, product, filiere=None, offset=0, n=10):
+    """(zones ranked offset+1 to offset+n as dicts, number of ranked zones)."""
+    store = memory_store()
+    if store is not None:
+        ids, names, region_names, tonnes = store.ranking(level, product, filiere)
+        page = range(offset, min(offset + n, len(ids)))
+        zones = [
+            {'rank': i + 1, 'id': ids[i], 'name': names[i], 'region_name': region_names[i], 'tonnes': tonnes[i]}
+            for i in page
+        ]
+        return zones, len(ids)
+
+    partition = db.session.query(ProductionRanking).filter(
+        ProductionRanking.level == level,
+        ProductionRanking.product == product,
+        ProductionRanking.filiere == filiere if filiere else ProductionRanking.filiere.is_(None)
+    )
+    # Both are range scans of (level, product, filiere, rank): no aggregation nor sort
+    total = partition.with_entities(func.max(ProductionRanking.rank)).scalar() or 0
+    rows = fetch_all(partition.with_entities(
+        ProductionRanking.rank, ProductionRanking.zone_id, ProductionRanking.zone_name,
+        ProductionRanking.region_name, ProductionRanking.tonnes
+    ).filter(
+        ProductionRanking.rank > offset, ProductionRanking.rank <= offset + n
+    ).order_by(ProductionRanking.rank))
+    zones = [
+        {'rank': rank, 'id': zone_id, 'name': name, 'region_name': region_name, 'tonnes': tonnes}
+        for rank, zone_id, name, region_name, tonnes in rows
+    ]
+    return zones, total
+
+@app.route('/api/top')
+def get_top():
+    """
+    Zones of ?level= ranked by all-years tonnage of ?product= (optionally within ?filiere=),
+    without geometry. ?n= zones per page (default 10) from ?offset= (default 0).
+    """
+    level = request.args.get('level', default='communes', type=str)
+    if level not in ZONE_MODELS:
+        return jsonify({'error': f'Unknown level {level}'}), 400
+    product = request.args.get('product', default=None, type=str)
+    if not product:
+        return jsonify({'error': 'Missing product parameter'}), 400
+    filiere = normalize_filiere(request.args.get('filiere', default=None, type=str))
+    n = request.args.get('n', default=10, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    if not 1 <= n <= RANKING_MAX_N or offset < 0:
+        return jsonify({'error': f'n must be between 1 and {RANKING_MAX_N} and offset non-negative'}), 400
+
+    def build():
+        zones, total = ranked_zones(level, product, filiere, offset, n)
+        return {
+            'level': level,
+            'product': product,
+            'filiere': filiere,
+            'data_version': get_data_version(),
+            'total': total,
+            'offset': offset,
+            'n': n,
+            'next_offset': offset + n if offset + n < total else None,
+            'zones': zones
+        }
+
+    return cached_response(
+        ranking_cache, (level, product, filiere, offset, n), json_body(build), 'application/json', shared=False
+    )
+
+# --- Metrics ---
+
+def cache_metrics():
+    """Prometheus lines for the lookups, hit ratio and size of every cache."""
+    caches = {cache.name: cache for cache in (response_cache, filtered_cache, geometry_cache, tile_cache,
+                                              export_cache, aggregate_cache, ranking_cache)}
+    lookups = ['# HELP geoprod_cache_requests_total Cache lookups by result.',
+               '# TYPE geoprod_cache_requests_total counter']
+    ratios = ['# HELP geoprod_cache_hit_ratio Share of cache lookups that were hits.',
+              '# TYPE geoprod_cache_hit_ratio gauge']
+    sizes = ['# HELP geoprod_cache_entries Entries currently held.', '# TYPE geoprod_cache_entries gauge']
+    for name, cache in caches.items():
+        hits, misses = cache.hits, cache.misses
+        lookups.append(f'geoprod_cache_requests_total{{cache="{name}",result="hit"}} {hits}')
+        lookups.append(f'geoprod_cache_requests_total{{cache="{name}",result="miss"}} {misses}')
+        ratios.append(f'geoprod_cache_hit_ratio{{cache="{name}"}} {hits / (hits + misses) if hits + misses else 0}')
+        sizes.append(f'geoprod_cache_entries{{cache="{name}"}} {len(cache)}')
+    coalesced = ['# HELP geoprod_coalesced_requests_total Cache misses that waited for an identical build in flight.',
+                 '# TYPE geoprod_coalesced_requests_total counter',
+                 f'geoprod_coalesced_requests_total {single_flight.coalesced}']
+    return lookups + ratios + sizes + coalesced
+
+def pool_metrics():
+    """Prometheus lines for the SQLAlchemy connection pool of this process."""
+    pool = db.engine.pool
+    lines = []
+    for stat, help_text in (('size', 'Configured pool size.'),
+                            ('checkedout', 'Connections in use.'),
+                            ('checkedin', 'Idle connections in the pool.'),
+                            ('overflow', 'Connections opened beyond the pool size.')):
+        method = getattr(pool, stat, None)
+        if method is None:
+            continue
+        lines.append(f'# HELP geoprod_db_pool_{stat} {help_text}')
+        lines.append(f'# TYPE geoprod_db_pool_{stat} gauge')
+        lines.append(f'geoprod_db_pool_{stat} {method()}')
+    return lines
+
+@app.route('/api/metrics')
+def get_metrics():
+    """
+    Metrics in the Prometheus text format. They are per process: behind
+    gunicorn each scrape reports the worker that served it.
+    """
+    lines = ['# HELP geoprod_process_info Worker process serving this scrape.',
+             '# TYPE geoprod_process_info gauge',
+             f'geoprod_process_info{{pid="{os.getpid()}",data_version="{escape_label(get_data_version())}"}} 1']
+    for histogram in (request_duration, phase_duration, response_size):
+        lines.extend(histogram.exposition())
+    lines.extend(cache_metrics())
+    lines.extend(pool_metrics())
+    return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- Warm-up ---
+# Set WARMUP=0 to report healthy without priming the caches first
+WARMUP_ENABLED = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")
+
+_warmed_up = threading.Event()
+_warm_up_lock = threading.Lock()
+
+def warm_up():
+    """
+    Prime the DB connection pool, query plans and the response cache with the
+    default map of every level and filiere, so the first users don't pay for it.
+    With SERVING_MODE=memory the in-memory store is loaded first.
+    /api/health reports unhealthy until this has succeeded once.
+    """
+    if _warmed_up.is_set():
+        return True
+    with _warm_up_lock:
+        if _warmed_up.is_set():
+            return True
+        with app.app_context():
+            try:
+                started = time.perf_counter()
+                static_manifest()
+                memory_store()
+                for level in ZONE_MODELS:
+                    for filiere in (None,) + FILIERES:
+                        cached_entry(
+                            response_cache, level_cache_key(level, filiere),
+                            lambda: render_level(level, filiere)
+                        )
+                precompute_exports()
+                _warmed_up.set()
+                app.logger.info("Warm-up done in %.2fs", time.perf_counter() - started)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Warm-up failed, will retry on next health check")
+            finally:
+                db.session.remove()
+    return _warmed_up.is_set()
+
+def warm_up_in_background():
+    """
+    Whether the worker is warmed up; if not, start warm_up() in a background thread
+    unless one is already running. Never waits, so health probes answer at once.
+    """
+    if _warmed_up.is_set():
+        return True
+    if not _warm_up_lock.locked():
+        # Two probes may both start one: the second thread returns once the first is done
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    return False
+
+if not WARMUP_ENABLED:
+    _warmed_up.set()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint for Docker container"""
     try:
         # Test database connection
-        db.session.execute('SELECT 1')
-        return jsonify({'status': 'healthy', 'message': 'Server and database are operational'}), 200
+        db.session.execute(text('SELECT 1'))
     except Exception as e:
+        db.session.rollback()
+        # Data served from memory stays available while the database is away
+        if _memory_store['store'] is not None:
+            return jsonify({'status': 'degraded', 'message': 'Serving from memory, database unreachable',
+                            'error': str(e)}), 200
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
+    if not warm_up_in_background():
+        return jsonify({'status': 'starting', 'message': 'Warming up caches'}), 503
+    return jsonify({'status': 'healthy', 'message': 'Server and database are operational'}), 200
+
+# --- Static assets ---
+# The built SPA is read once into memory with its gzip and brotli copies, so serving it
+# never touches the filesystem. Vite fingerprints the files of assets/ (name-<hash>.ext):
+# their URL changes with their content, so browsers may keep them for a year.
+STATIC_MAX_FILE_BYTES = int(os.getenv("STATIC_MAX_FILE_BYTES", str(8 * 1024 ** 2)))
+COMPRESSIBLE_MIMETYPES = ('text/', 'application/javascript', 'application/json', 'application/manifest+json',
+                          'application/wasm', 'image/svg+xml')
+FINGERPRINTED_ASSET = re.compile(r'(?:^|/)assets/.+-[A-Za-z0-9_-]{8,}\.\w+$')
+
+try:
+    import brotli
+except ImportError: # optional: assets are only pre-gzipped without it
+    brotli = None
+
+class StaticAsset:
+    """File of the static directory, its pre-compressed copies and its strong ETag."""
+    __slots__ = ('body', 'encodings', 'etag', 'mimetype', 'immutable')
+
+    def __init__(self, path, body):
+        self.body = body
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.immutable = FINGERPRINTED_ASSET.search(path) is not None
+        # Preferred encoding first, only kept when smaller than the original
+        self.encodings = {}
+        if len(body) >= 256 and self.mimetype.startswith(COMPRESSIBLE_MIMETYPES):
+            candidates = []
+            if brotli is not None:
+                candidates.append(('br', brotli.compress(body, quality=11)))
+            candidates.append(('gzip', gzip.compress(body, compresslevel=9, mtime=0)))
+            self.encodings = {name: compressed for name, compressed in candidates if len(compressed) < len(body)}
+
+def load_static_manifest(root):
+    """
+    {URL path: StaticAsset} of the files under `root`. Files larger than
+    STATIC_MAX_FILE_BYTES map to None and are sent from disk.
+    """
+    manifest = {}
+    if not os.path.isdir(root):
+        return manifest
+    started = time.perf_counter()
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            filepath = os.path.join(directory, filename)
+            path = os.path.relpath(filepath, root).replace(os.sep, '/')
+            if os.path.getsize(filepath) > STATIC_MAX_FILE_BYTES:
+                manifest[path] = None
+                continue
+            with open(filepath, 'rb') as f:
+                manifest[path] = StaticAsset(path, f.read())
+    app.logger.info("%d static files loaded in %.2fs", len(manifest), time.perf_counter() - started)
+    return manifest
+
+_static_manifest = {'manifest': None}
+_static_manifest_lock = threading.Lock()
+
+def static_manifest():
+    """Manifest of STATIC_DIR, built on first use (warm-up) rather than at import."""
+    manifest = _static_manifest['manifest']
+    if manifest is None:
+        with _static_manifest_lock:
+            manifest = _static_manifest['manifest']
+            if manifest is None:
+                manifest = _static_manifest['manifest'] = load_static_manifest(STATIC_DIR)
+    return manifest
+
+def static_response(asset):
+    """Response of a StaticAsset, in the best encoding accepted, with If-None-Match (304) handling."""
+    # Best quality accepted, br before gzip on a tie; q=0 refuses an encoding
+    encoding, best = None, 0
+    for name in asset.encodings:
+        quality = request.accept_encodings[name]
+        if quality > best:
+            encoding, best = name, quality
+    etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(asset.etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.encodings[encoding] if encoding else asset.body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if asset.immutable else 'no-cache'
+    if asset.encodings:
+        response.vary.add('Accept-Encoding')
+    return response
 
-# Serve static files for SPA
 @app.route('/', methods=['GET'])
 def serve_index():
     """Serve the main index.html"""
-    return send_from_directory(STATIC_DIR, 'index.html')
+    asset = static_manifest().get('index.html')
+    if asset is None:
+        return send_from_directory(STATIC_DIR, 'index.html')
+    return static_response(asset)
 
 @app.route('/<path:path>', methods=['GET'])
 def serve_static(path):
     """Serve static assets, fallback to index.html for SPA routing"""
-    if os.path.exists(os.path.join(STATIC_DIR, path)):
-        return send_from_directory(STATIC_DIR, path)
-    else:
+    manifest = static_manifest()
+    if path not in manifest:
         # For SPA routing, serve index.html
-        return send_from_directory(STATIC_DIR, 'index.html')
+        return serve_index()
+    asset = manifest[path]
+    if asset is None:
+        return send_from_directory(STATIC_DIR, path)
+    return static_response(asset)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    # Development server; in production use: gunicorn -c gunicorn.conf.py app:app
+    if WARMUP_ENABLED:
+        warm_up()
+    app.run(host='0.0.0.0', port=int(os.getenv("PORT", "5000")), debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Exporte les réponses de l'API en fichiers statiques servis directement par nginx
+(voir nginx.conf), sans passer par Flask ni PostGIS:
+
+    python export_snapshot.py [--output DIR] [--tile-max-zoom N] [--keep N]
+
+Pour la version des données courante, on écrit dans DIR/releases/<version>/:
+  - api/<niveau>/<variante>.json       GeoJSON de /api/<niveau>[?filiere=...]
+  - api/attributes/<niveau>/<variante>.json
+  - api/geometry/<niveau>/index.json   géométries seules
+  - api/tiles/<niveau>/<z>/<x>/<y>.pbf tuiles vectorielles jusqu'à --tile-max-zoom
+avec des copies précompressées .gz (et .br si le paquet brotli est installé),
+puis DIR/current est basculé atomiquement vers cette version (lien symbolique).
+"""
+import gzip
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import unicodedata
+from datetime import datetime
+
+try:
+    import brotli
+except ImportError: # optional: only .gz siblings are written without it
+    brotli = None
+
+from sqlalchemy import func
+
+from app import (FILIERES, ZONE_MODELS, Region, app, build_attributes, build_geometry_collection, db,
+                 dumps_json, get_data_version, render_level, render_tile)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") or os.path.join(BASE_DIR, '..', 'snapshots')
+TILE_MAX_ZOOM = int(os.getenv("SNAPSHOT_TILE_MAX_ZOOM", "10"))
+KEEP_RELEASES = int(os.getenv("SNAPSHOT_KEEP", "3"))
+# Below this size a compressed copy isn't worth it
+MIN_COMPRESS_BYTES = 256
+
+def filiere_variant(filiere):
+    """Nom de fichier d'une filière: 'index' pour toutes, sinon en ASCII ('Élevage' -> 'elevage')."""
+    if filiere is None:
+        return 'index'
+    return unicodedata.normalize('NFKD', filiere).encode('ascii', 'ignore').decode('ascii').lower()
+
+def write_file(release_dir, path, body, manifest):
+    """Écrit un fichier de l'export et ses copies .gz/.br, et le référence dans le manifeste."""
+    filepath = os.path.join(release_dir, path)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'wb') as f:
+        f.write(body)
+    if len(body) >= MIN_COMPRESS_BYTES:
+        with open(filepath + '.gz', 'wb') as f:
+            f.write(gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(filepath + '.br', 'wb') as f:
+                f.write(brotli.compress(body, quality=11))
+    manifest[path] = {'bytes': len(body), 'sha256': hashlib.sha256(body).hexdigest()}
+
+def tile_range(bounds, z):
+    """(x_min, x_max, y_min, y_max) des tuiles XYZ couvrant une emprise lon/lat au zoom z."""
+    minx, miny, maxx, maxy = bounds
+    n = 2 ** z
+
+    def tile_x(lon):
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def tile_y(lat):
+        lat = math.radians(max(-85.0511, min(85.0511, lat)))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    return tile_x(minx), tile_x(maxx), tile_y(maxy), tile_y(miny)
+
+def export_release(release_dir, tile_max_zoom):
+    """Écrit tous les fichiers de la version courante. Retourne le manifeste."""
+    manifest = {}
+    for level in ZONE_MODELS:
+        for filiere in (None,) + FILIERES:
+            variant = filiere_variant(filiere)
+            write_file(release_dir, f'api/{level}/{variant}.json', render_level(level, filiere), manifest)
+            write_file(release_dir, f'api/attributes/{level}/{variant}.json',
+                       dumps_json(build_attributes(level, [filiere])), manifest)
+        write_file(release_dir, f'api/geometry/{level}/index.json', build_geometry_collection(level, 0), manifest)
+        print(f"  {level}: GeoJSON, attributes and geometry exported")
+
+    if tile_max_zoom >= 0:
+        bounds = db.session.query(
+            func.ST_XMin(func.ST_Extent(Region.geom)), func.ST_YMin(func.ST_Extent(Region.geom)),
+            func.ST_XMax(func.ST_Extent(Region.geom)), func.ST_YMax(func.ST_Extent(Region.geom))
+        ).one()
+        if bounds[0] is not None:
+            for level in ZONE_MODELS:
+                count = 0
+                for z in range(tile_max_zoom + 1):
+                    x_min, x_max, y_min, y_max = tile_range(bounds, z)
+                    for x in range(x_min, x_max + 1):
+                        for y in range(y_min, y_max + 1):
+                            write_file(release_dir, f'api/tiles/{level}/{z}/{x}/{y}.pbf',
+                                       render_tile(level, z, x, y), manifest)
+                            count += 1
+                print(f"  {level}: {count} tiles exported (zoom 0-{tile_max_zoom})")
+    return manifest
+
+def publish(output, version):
+    """Bascule output/current vers releases/<version> par renommage atomique d'un lien symbolique."""
+    current = os.path.join(output, 'current')
+    staging = f'{current}.tmp-{os.getpid()}'
+    os.symlink(os.path.join('releases', version), staging)
+    os.replace(staging, current)
+
+def prune_releases(output, keep):
+    """Supprime les anciennes versions exportées, en gardant les `keep` plus récentes et la courante."""
+    releases_dir = os.path.join(output, 'releases')
+    current = os.path.realpath(os.path.join(output, 'current'))
+    releases = sorted(
+        (entry for entry in os.scandir(releases_dir) if entry.is_dir() and not entry.name.startswith('.')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+    for entry in releases[keep:]:
+        if os.path.realpath(entry.path) != current:
+            shutil.rmtree(entry.path)
+            print(f"Removed old snapshot {entry.name}")
+
+def export_snapshot(output=SNAPSHOT_DIR, tile_max_zoom=TILE_MAX_ZOOM, keep=KEEP_RELEASES, force=False):
+    """Exporte la version courante des données si nécessaire et la publie. Retourne la version."""
+    output = os.path.abspath(output)
+    with app.app_context():
+        version = get_data_version()
+        release_dir = os.path.join(output, 'releases', version)
+        if os.path.isdir(release_dir) and not force:
+            print(f"Snapshot {version} already exported")
+        else:
+            print(f"Exporting snapshot {version} to {release_dir}...")
+            started = time.perf_counter()
+            # Écrit à côté puis renomme: une version n'est jamais visible à moitié écrite
+            building_dir = os.path.join(output, 'releases', f'.{version}.tmp-{os.getpid()}')
+            shutil.rmtree(building_dir, ignore_errors=True)
+            os.makedirs(building_dir)
+            try:
+                manifest = export_release(building_dir, tile_max_zoom)
+                write_file(building_dir, 'manifest.json', json.dumps({
+                    'data_version': version,
+                    'exported_at': datetime.utcnow().isoformat() + 'Z',
+                    'files': manifest
+                }, indent=1).encode('utf-8'), {})
+                if os.path.isdir(release_dir):
+                    shutil.rmtree(release_dir)
+                os.rename(building_dir, release_dir)
+            except Exception:
+                shutil.rmtree(building_dir, ignore_errors=True)
+                raise
+            finally:
+                db.session.remove()
+            print(f"Snapshot exported: {len(manifest)} files in {time.perf_counter() - started:.1f}s")
+
+    publish(output, version)
+    prune_releases(output, keep)
+    print(f"Snapshot {version} published at {os.path.join(output, 'current')}")
+    return version
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporte les réponses de l'API en fichiers statiques pour nginx.")
+    parser.add_argument('--output', default=SNAPSHOT_DIR, help="dossier des exports (défaut: $SNAPSHOT_DIR)")
+    parser.add_argument('--tile-max-zoom', type=int, default=TILE_MAX_ZOOM,
+                        help="zoom maximal des tuiles exportées (-1 pour aucune)")
+    parser.add_argument('--keep', type=int, default=KEEP_RELEASES, help="nombre de versions conservées")
+    parser.add_argument('--force', action='store_true', help="réexporter même si la version existe déjà")
+    args = parser.parse_args()
+
+    export_snapshot(args.output, args.tile_max_zoom, args.keep, args.force)
@@ -0,0 +1,213 @@
+"""
+Compact encoders of aggregated zones for /api/<level>?format=:
+TopoJSON (quantized coordinates, borders shared between zones stored once)
+and Arrow IPC / GeoParquet (columnar attributes, WKB geometry).
+FlatGeobuf is written by PostGIS itself (ST_AsFlatGeobuf), see app.py.
+"""
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # optional, only needed for the arrow and parquet formats
+    pa = pq = None
+
+# --- TopoJSON ---
+
+def polygons_of(geometry):
+    """Polygons (lists of rings) of a GeoJSON Polygon or MultiPolygon."""
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+def coordinates_bbox(geometries):
+    """(minx, miny, maxx, maxy) of all the polygon coordinates of `geometries`."""
+    xs, ys = [], []
+    for geometry in geometries:
+        for polygon in polygons_of(geometry):
+            for ring in polygon:
+                xs.extend(point[0] for point in ring)
+                ys.extend(point[1] for point in ring)
+    if not xs:
+        return (0.0, 0.0, 0.0, 0.0)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+class Topology:
+    """
+    Builds a TopoJSON topology from GeoJSON polygons. Rings are quantized, cut at
+    junctions (points where the neighbouring zones change) and every resulting arc
+    is stored once, referenced by index (~index when traversed in reverse).
+    """
+
+    def __init__(self, bbox, quantization):
+        minx, miny, maxx, maxy = bbox
+        self.bbox = bbox
+        self.translate = (minx, miny)
+        self.scale = ((maxx - minx) / (quantization - 1) if maxx > minx else 1.0,
+                      (maxy - miny) / (quantization - 1) if maxy > miny else 1.0)
+        self.arcs = []
+        self._arc_index = {}
+
+    def quantize(self, ring):
+        """Closed ring of integer points without consecutive duplicates, None if degenerate."""
+        (x0, y0), (kx, ky) = self.translate, self.scale
+        points = []
+        for point in ring:
+            quantized = (round((point[0] - x0) / kx), round((point[1] - y0) / ky))
+            if not points or points[-1] != quantized:
+                points.append(quantized)
+        if points[0] != points[-1]:
+            points.append(points[0])
+        return points if len(points) >= 4 else None
+
+    @staticmethod
+    def junctions(rings):
+        """Points reached with different neighbours by different rings."""
+        neighbours = {}
+        junctions = set()
+        for ring in rings:
+            vertices = ring[:-1]
+            for i, point in enumerate(vertices):
+                pair = tuple(sorted((vertices[i - 1], vertices[(i + 1) % len(vertices)])))
+                seen = neighbours.setdefault(point, pair)
+                if seen != pair:
+                    junctions.add(point)
+        return junctions
+
+    def arc_id(self, points):
+        key = tuple(points)
+        index = self._arc_index.get(key)
+        if index is not None:
+            return index
+        index = self._arc_index.get(key[::-1])
+        if index is not None:
+            return ~index
+        index = self._arc_index[key] = len(self.arcs)
+        self.arcs.append(key)
+        return index
+
+    def ring_arcs(self, ring, junctions):
+        vertices = ring[:-1]
+        cuts = [i for i, point in enumerate(vertices) if point in junctions]
+        if not cuts:
+            # Ring shared as a whole (or not at all): start at its smallest point so
+            # that both traversals of the same ring produce the same arc
+            start = vertices.index(min(vertices))
+            return [self.arc_id(vertices[start:] + vertices[:start + 1])]
+        rotated = vertices[cuts[0]:] + vertices[:cuts[0] + 1]
+        arcs, start = [], 0
+        for i in range(1, len(rotated)):
+            if rotated[i] in junctions:
+                arcs.append(self.arc_id(rotated[start:i + 1]))
+                start = i
+        return arcs
+
+    def encoded_arcs(self):
+        """Arcs delta-encoded as in the TopoJSON specification."""
+        encoded = []
+        for arc in self.arcs:
+            x = y = 0
+            deltas = []
+            for px, py in arc:
+                deltas.append([px - x, py - y])
+                x, y = px, py
+            encoded.append(deltas)
+        return encoded
+
+def build_topology(name, features, quantization=100000):
+    """
+    TopoJSON dict with one GeometryCollection object `name` from (id, GeoJSON
+    geometry dict or None, properties) features.
+    """
+    features = list(features)
+    topology = Topology(coordinates_bbox(geometry for _, geometry, _ in features), quantization)
+
+    quantized = []
+    for zone_id, geometry, properties in features:
+        polygons = []
+        for polygon in polygons_of(geometry):
+            rings = [topology.quantize(ring) for ring in polygon]
+            # A polygon whose exterior collapses at this quantization is dropped
+            if rings and rings[0] is not None:
+                polygons.append([ring for ring in rings if ring is not None])
+        quantized.append((zone_id, polygons, properties))
+
+    junctions = topology.junctions(ring for _, polygons, _ in quantized for polygon in polygons for ring in polygon)
+
+    geometries = []
+    for zone_id, polygons, properties in quantized:
+        arcs = [[topology.ring_arcs(ring, junctions) for ring in polygon] for polygon in polygons]
+        if arcs:
+            geometries.append({'type': 'MultiPolygon', 'id': zone_id, 'arcs': arcs, 'properties': properties})
+        else:
+            geometries.append({'type': None, 'id': zone_id, 'properties': properties})
+
+    return {
+        'type': 'Topology',
+        'bbox': list(topology.bbox),
+        'transform': {'scale': list(topology.scale), 'translate': list(topology.translate)},
+        'objects': {name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': topology.encoded_arcs()
+    }
+
+# --- Arrow / GeoParquet ---
+
+# GeoArrow extension metadata on the WKB geometry column
+GEOARROW_WKB = {b'ARROW:extension:name': b'geoarrow.wkb', b'ARROW:extension:metadata': b'{}'}
+
+def zone_table(zones, wkb_geometries, filieres):
+    """
+    Arrow table with one row per ZoneAggregate: flat tonnage columns per filiere,
+    product tonnages as a map column and the zone geometry as WKB.
+    """
+    columns = {
+        'id': [], 'name': [], 'region_name': [], 'total_tonnes': [], 'dominant_filiere': [],
+        'product_tonnes': [], 'geometry': []
+    }
+    per_filiere = {filiere: [] for filiere in filieres}
+    for zone_id, zone in zones.items():
+        filiere_tonnes = zone.filiere_tonnes
+        columns['id'].append(zone_id)
+        columns['name'].append(zone.name)
+        columns['region_name'].append(zone.region_name)
+        columns['total_tonnes'].append(zone.total_tonnes)
+        columns['dominant_filiere'].append(max(filiere_tonnes, key=filiere_tonnes.get) if filiere_tonnes else None)
+        columns['product_tonnes'].append(list(zone.product_tonnes.items()))
+        columns['geometry'].append(wkb_geometries.get(zone_id))
+        for filiere, values in per_filiere.items():
+            values.append(filiere_tonnes.get(filiere, 0))
+    for filiere, values in per_filiere.items():
+        columns[f'tonnes_{filiere}'] = values
+
+    schema = pa.schema(
+        [pa.field('id', pa.int64()), pa.field('name', pa.string()), pa.field('region_name', pa.string()),
+         pa.field('total_tonnes', pa.float64()), pa.field('dominant_filiere', pa.string())]
+        + [pa.field(f'tonnes_{filiere}', pa.float64()) for filiere in filieres]
+        + [pa.field('product_tonnes', pa.map_(pa.string(), pa.float64())),
+           pa.field('geometry', pa.binary(), metadata=GEOARROW_WKB)]
+    )
+    return pa.Table.from_pydict(columns, schema=schema)
+
+def arrow_ipc_bytes(table):
+    """Table as an Arrow IPC stream."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def geoparquet_bytes(table):
+    """Table as a GeoParquet 1.0 file (WKB geometry, lon/lat CRS84 by default)."""
+    geo = {
+        'version': '1.0.0',
+        'primary_column': 'geometry',
+        'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': ['MultiPolygon']}}
+    }
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'geo'] = json.dumps(geo).encode('utf-8')
+    sink = pa.BufferOutputStream()
+    pq.write_table(table.replace_schema_metadata(metadata), sink, compression='zstd')
+    return sink.getvalue().to_pybytes()
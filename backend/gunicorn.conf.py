@@ -0,0 +1,30 @@
+# Gunicorn configuration for production serving:
+#   gunicorn -c gunicorn.conf.py app:app
+# Each worker process has its own DB connection pool (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# and its own response caches, primed by warm_up() before /api/health reports healthy.
+import os
+import threading
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# Fixed rather than sized from the CPU count: workers × (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# connections must stay under PostgreSQL's max_connections (100 by default)
+workers = int(os.getenv("WEB_WORKERS", "4"))
+threads = int(os.getenv("WEB_THREADS", "4"))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Workers aren't recycled by default: caches are bounded LRUs, and a new worker pays for a
+# full warm-up. With WEB_MAX_REQUESTS set, the jitter keeps workers from restarting together.
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")
+
+
+def post_worker_init(worker):
+    # Prime caches in the background; /api/health answers 503 meanwhile without waiting
+    from app import warm_up, WARMUP_ENABLED
+    if WARMUP_ENABLED:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
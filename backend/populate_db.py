@@ -6,14 +6,23 @@ from sqlalchemy.orm import relationship
 
 import json
 import csv
+import hashlib
+import io
+import itertools
 import os
 import re
+import time
+import uuid
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from shapely import wkb
 from shapely.geometry import shape
-from geoalchemy2.shape import from_shape
 from collections import defaultdict
 
 # Import models and static data from app.py
-from app import Region, Department, Commune, ProductionData
+from app import GEOMETRY_LODS
 
 # --- Mapping des régions (différents noms dans les CSV) ---
 REGION_NAME_MAPPING = {
@@ -39,61 +48,107 @@ REGION_NAME_MAPPING = {
     'SOUTH WEST': 'Sud-Ouest'
 }
 
+# Préfixes retirés dans l'ordre ("volume de production du", puis "de", puis "production")
+# et suffixe "production", en une seule passe
+_PRODUCT_AFFIXES = re.compile(
+    r'^(?:volume de production du\s+)?(?:volume de production de\s+)?(?:production\s+)?|\s+production$'
+)
+# "beaf meat" → "beaf", "goat meat x" → "goat x"
+_PRODUCT_MEAT = re.compile(r'\s+meat(\s+|$)')
+_PRODUCT_PROD_SUFFIX = re.compile(r'\s+(prod)$')
+
+@lru_cache(maxsize=None)
 def clean_product_name(indicateur):
     """
     Nettoie le nom du produit/indicateur en supprimant les préfixes/suffixes
     'Volume de production du' ou 'production', etc.
+    Mémoïsé: un fichier ne contient que quelques indicateurs distincts.
     """
     text = indicateur.lower().strip()
-    
-    # Supprimer les suffixes "production" à la fin d'abord
-    text = re.sub(r'\s+production$', '', text)
-    
-    # Supprimer les préfixes communs
-    text = re.sub(r'^volume de production du\s+', '', text)
-    text = re.sub(r'^volume de production de\s+', '', text)
-    text = re.sub(r'^production\s+', '', text)
-    
+    text = _PRODUCT_AFFIXES.sub('', text)
+
     # Supprimer "meat" mais garder le type de viande
-    # "beaf meat" → "beaf", "goat meat" → "goat", etc.
-    text = re.sub(r'\s+meat$', '', text)
-    text = re.sub(r'\s+meat\s+', ' ', text)
-    
+    text = _PRODUCT_MEAT.sub(lambda m: ' ' if m.group(1) else '', text)
+
     # Supprimer d'autres suffixes inutiles
-    text = re.sub(r'\s+(prod)$', '', text)
-    
+    text = _PRODUCT_PROD_SUFFIX.sub('', text)
+
     # Capitaliser la première lettre
-    text = text.capitalize()
-    
-    return text.strip()
+    return text.capitalize().strip()
+
+@lru_cache(maxsize=None)
+def normalize_region_name(region):
+    """Nom de région des CSV → nom utilisé dans les GeoJSON."""
+    region_raw = region.strip().upper()
+    return REGION_NAME_MAPPING.get(region_raw, region_raw)
+
+class ProductionBatch:
+    """Production agrégée d'une filière, en colonnes prêtes pour le COPY."""
+    __slots__ = ('filiere', 'regions', 'products', 'years', 'tonnes')
+
+    def __init__(self, filiere):
+        self.filiere = filiere
+        self.regions = []
+        self.products = []
+        self.years = array('i')
+        self.tonnes = array('d')
+
+    def __len__(self):
+        return len(self.tonnes)
+
+    def rows(self):
+        """Lignes (filiere, product, year, tonnes, region_name) pour staging_production."""
+        filiere = self.filiere
+        return ((filiere, product, year, tonnes, region)
+                for region, product, year, tonnes in zip(self.regions, self.products, self.years, self.tonnes))
 
-def load_csv_data(filepath, filiere):
+def read_production_file(filepath, filiere):
     """
-    Charge les données d'un fichier CSV et retourne un dict {region: {product: tonnes}}
+    Lit un fichier CSV de production en flux et l'agrège par (région, produit, année).
+    Retourne un ProductionBatch sans les tonnages nuls.
     """
-    data = defaultdict(lambda: defaultdict(float))
-    
+    totals = defaultdict(float)
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            indicateur_col = header.index('indicateur')
+            region_col = header.index('region')
+            value_col = header.index('Value')
+            date_col = header.index('Date')
             for row in reader:
-                region_raw = row['region'].strip().upper()
-                region_mapped = REGION_NAME_MAPPING.get(region_raw, region_raw)
-                
-                indicateur = row['indicateur'].strip()
-                product = clean_product_name(indicateur)
-                
                 try:
-                    tonnes = float(row['Value'])
-                    # Agréger par région et produit (en cas de plusieurs années)
-                    data[region_mapped][product] += tonnes
-                except ValueError:
+                    tonnes = float(row[value_col])
+                    # "2013" ou "2013-01-01"
+                    year = int(row[date_col].strip()[:4])
+                except (ValueError, IndexError):
                     continue
+                key = (normalize_region_name(row[region_col]), clean_product_name(row[indicateur_col].strip()), year)
+                totals[key] += tonnes
     except Exception as e:
         print(f"Erreur lors de la lecture de {filepath}: {e}")
-    
-    return data
 
+    batch = ProductionBatch(filiere)
+    for (region, product, year), tonnes in totals.items():
+        if tonnes > 0:
+            batch.regions.append(region)
+            batch.products.append(product)
+            batch.years.append(year)
+            batch.tonnes.append(tonnes)
+    return batch
+
+# Nombre de processus pour lire les fichiers de production (1 = lecture séquentielle)
+LOADER_WORKERS = int(os.getenv("LOADER_WORKERS", str(os.cpu_count() or 1)))
+
+def read_production_sources(sources):
+    """Lit les fichiers (chemin, filière) en parallèle dans un pool de processus."""
+    filepaths = [filepath for filepath, _ in sources]
+    filieres = [filiere for _, filiere in sources]
+    workers = min(LOADER_WORKERS, len(sources))
+    if workers <= 1:
+        return list(map(read_production_file, filepaths, filieres))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_production_file, filepaths, filieres))
 
 # Database connection parameters (from environment variables)
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -110,64 +165,185 @@ db = SQLAlchemy(app)
 
 # Get the base directory for data files
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# Look for data directory in /app/data (mounted volume) or relative to backend dir
-DATA_DIR = os.path.join(BASE_DIR, '..', 'data')
+# Look for data directory in $DATA_DIR, /app/data (mounted volume) or relative to backend dir
+DATA_DIR = os.getenv("DATA_DIR") or os.path.join(BASE_DIR, '..', 'data')
 if not os.path.exists(DATA_DIR):
     DATA_DIR = '/app/data'
 DATA_DIR = os.path.abspath(DATA_DIR)
 
-def load_geojson(filename):
+GEOJSON_CHUNK_SIZE = 1 << 20
+
+def iter_geojson_features(filename, chunk_size=GEOJSON_CHUNK_SIZE):
+    """
+    Itère sur les Features d'une FeatureCollection sans charger tout le fichier:
+    seuls le texte de la Feature en cours et un bloc de lecture sont en mémoire.
+    Seul le membre "features" de l'objet racine est lu (pas une clé "features"
+    imbriquée dans "metadata" ou des propriétés); les autres membres sont sautés.
+    """
     filepath = os.path.join(DATA_DIR, filename)
+    decoder = json.JSONDecoder()
     with open(filepath, 'r', encoding='utf-8') as f:
-        return json.load(f)
+        buffer, pos = '', 0
+
+        def fill():
+            # Lire au moins autant que ce qu'on a déjà, pour ne redécoder une
+            # valeur incomplète qu'un nombre logarithmique de fois
+            nonlocal buffer, pos
+            chunk = f.read(max(chunk_size, len(buffer) - pos))
+            if not chunk:
+                return False
+            buffer, pos = buffer[pos:] + chunk, 0
+            return True
+
+        def peek():
+            """Prochain caractère significatif ('' en fin de fichier)."""
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n\ufeff':
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not fill():
+                    return ''
+
+        def decode():
+            """Valeur JSON complète à partir de la position courante."""
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if not fill():
+                        raise
+                    continue
+                # Un nombre coupé en fin de bloc se décode sans erreur: on relit pour en être sûr
+                if end < len(buffer) or not fill():
+                    pos = end
+                    return value
+
+        if peek() != '{':
+            raise ValueError(f'{filepath}: not a GeoJSON object')
+        pos += 1
+        while True:
+            char = peek()
+            if char == ',':
+                pos += 1
+                continue
+            if char in ('}', ''):
+                raise ValueError(f'{filepath}: no "features" array')
+            key = decode()
+            if not isinstance(key, str) or peek() != ':':
+                raise ValueError(f'{filepath}: malformed GeoJSON object')
+            pos += 1
+            if key == 'features':
+                break
+            decode() # autre membre de la racine (type, crs, metadata...)
+
+        if peek() != '[':
+            raise ValueError(f'{filepath}: "features" is not an array')
+        pos += 1
+        while True:
+            char = peek()
+            if char == ',':
+                pos += 1
+                continue
+            if char == ']':
+                return
+            if not char:
+                raise ValueError(f'{filepath}: unterminated "features" array')
+            feature = decode()
+            if not isinstance(feature, dict) or feature.get('type') != 'Feature':
+                raise ValueError(f'{filepath}: "features" contains {feature!r:.80} instead of a Feature')
+            yield feature
+
+# Tables dans l'ordre de création (clés étrangères)
+TABLES = ('regions', 'departments', 'communes', 'production_data',
+          'region_counts', 'production_rollup', 'data_version', 'load_sources', 'zone_subdivisions',
+          'production_ranking')
+
+# Verrou consultatif (pg_advisory_xact_lock) pris par chaque chargement: deux conteneurs
+# démarrés en même temps chargent l'un après l'autre, le second ne trouvant plus rien à faire
+LOAD_LOCK_ID = 0x67656f70
+
+def add_missing_column(table, column, definition):
+    """
+    Ajoute une colonne à une table créée avant elle. information_schema est consulté
+    d'abord: même avec IF NOT EXISTS, ALTER TABLE prend un verrou ACCESS EXCLUSIVE,
+    qui attendrait la fin des lectures en cours de l'API et bloquerait les suivantes.
+    """
+    exists = db.session.execute(text('''
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column
+    '''), {'table': table, 'column': column}).first()
+    if exists is None:
+        db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {definition}'))
 
-def init_db_and_extensions():
+def init_db_and_extensions(rebuild=False):
+    """
+    Crée l'extension PostGIS et les tables manquantes. Les tables existantes
+    sont conservées, sauf avec `rebuild=True` qui les supprime d'abord.
+    """
     with app.app_context():
         try:
             print("Ensuring PostGIS extension is enabled...")
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': LOAD_LOCK_ID})
             db.session.execute(text('CREATE EXTENSION IF NOT EXISTS postgis'))
-            db.session.commit()
             print("PostGIS extension ensured.")
 
-            print("Dropping and recreating tables with raw SQL...")
+            if rebuild:
+                print("Dropping tables...")
+                # Drop tables in reverse order of creation due to foreign keys
+                for table in reversed(TABLES):
+                    db.session.execute(text(f'DROP TABLE IF EXISTS {table} CASCADE'))
 
-            # Drop tables in reverse order of creation due to foreign keys
-            db.session.execute(text('DROP TABLE IF EXISTS production_data CASCADE'))
-            db.session.execute(text('DROP TABLE IF EXISTS communes CASCADE'))
-            db.session.execute(text('DROP TABLE IF EXISTS departments CASCADE'))
-            db.session.execute(text('DROP TABLE IF EXISTS regions CASCADE'))
-            
-            # Create tables with raw SQL
+            print("Creating missing tables with raw SQL...")
             db.session.execute(text('''
-                CREATE TABLE regions (
+                CREATE TABLE IF NOT EXISTS regions (
                     id SERIAL PRIMARY KEY,
                     name VARCHAR UNIQUE NOT NULL,
-                    geom GEOMETRY(MULTIPOLYGON, 4326)
+                    geom GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod1 GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod2 GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod3 GEOMETRY(MULTIPOLYGON, 4326)
                 )
             '''))
             db.session.execute(text('''
-                CREATE TABLE departments (
+                CREATE TABLE IF NOT EXISTS departments (
                     id SERIAL PRIMARY KEY,
                     name VARCHAR UNIQUE NOT NULL,
                     geom GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod1 GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod2 GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod3 GEOMETRY(MULTIPOLYGON, 4326),
                     region_id INTEGER NOT NULL,
                     FOREIGN KEY(region_id) REFERENCES regions(id)
                 )
             '''))
             db.session.execute(text('''
-                CREATE TABLE communes (
+                CREATE TABLE IF NOT EXISTS communes (
                     id SERIAL PRIMARY KEY,
                     name VARCHAR UNIQUE NOT NULL,
                     geom GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod1 GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod2 GEOMETRY(MULTIPOLYGON, 4326),
+                    geom_lod3 GEOMETRY(MULTIPOLYGON, 4326),
                     department_id INTEGER NOT NULL,
                     FOREIGN KEY(department_id) REFERENCES departments(id)
                 )
             '''))
+            # Tables créées avant l'ajout des niveaux de détail: build_geometry_lods()
+            # remplit ensuite ces colonnes, restées à NULL
+            for table in ('regions', 'departments', 'communes'):
+                for column, _, _, _ in GEOMETRY_LODS:
+                    if column != 'geom':
+                        add_missing_column(table, column, 'GEOMETRY(MULTIPOLYGON, 4326)')
             db.session.execute(text('''
-                CREATE TABLE production_data (
+                CREATE TABLE IF NOT EXISTS production_data (
                     id SERIAL PRIMARY KEY,
                     filiere VARCHAR NOT NULL,
                     product VARCHAR NOT NULL,
+                    year INTEGER,
                     tonnes FLOAT NOT NULL,
                     region_id INTEGER,
                     department_id INTEGER,
@@ -177,125 +353,622 @@ def init_db_and_extensions():
                     FOREIGN KEY(commune_id) REFERENCES communes(id)
                 )
             '''))
+            # Tables créées avant l'ajout de la dimension temporelle
+            add_missing_column('production_data', 'year', 'INTEGER')
+            db.session.execute(text('DROP INDEX IF EXISTS ux_production_data_region_product'))
+            # Clé des upserts de production au niveau régional
+            db.session.execute(text('''
+                CREATE UNIQUE INDEX IF NOT EXISTS ux_production_data_region_product_year
+                ON production_data (filiere, product, region_id, year)
+                WHERE department_id IS NULL AND commune_id IS NULL
+            '''))
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_production_data_filiere_year_region '
+                'ON production_data (filiere, year, region_id)'
+            ))
+            db.session.execute(text('''
+                CREATE TABLE IF NOT EXISTS region_counts (
+                    region_id INTEGER PRIMARY KEY,
+                    dept_count INTEGER NOT NULL,
+                    commune_count INTEGER NOT NULL,
+                    FOREIGN KEY(region_id) REFERENCES regions(id)
+                )
+            '''))
+            db.session.execute(text('''
+                CREATE TABLE IF NOT EXISTS production_rollup (
+                    id SERIAL PRIMARY KEY,
+                    level VARCHAR NOT NULL,
+                    zone_id INTEGER NOT NULL,
+                    zone_name VARCHAR NOT NULL,
+                    region_name VARCHAR,
+                    filiere VARCHAR NOT NULL,
+                    product VARCHAR NOT NULL,
+                    year INTEGER,
+                    tonnes FLOAT NOT NULL
+                )
+            '''))
+            add_missing_column('production_rollup', 'year', 'INTEGER')
+            db.session.execute(text('DROP INDEX IF EXISTS ix_production_rollup_level_filiere'))
+            # year IS NULL: total toutes années confondues
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_production_rollup_level_year_filiere '
+                'ON production_rollup (level, year, filiere)'
+            ))
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_production_rollup_zone_product '
+                'ON production_rollup (level, zone_name, product, year)'
+            ))
+            # Filtres par zone: /api/locate, bbox et /api/aggregate
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_production_rollup_level_zone_year '
+                'ON production_rollup (level, zone_id, year)'
+            ))
+            # Classement des zones par produit (filiere NULL: toutes filières confondues)
+            db.session.execute(text('''
+                CREATE TABLE IF NOT EXISTS production_ranking (
+                    id SERIAL PRIMARY KEY,
+                    level VARCHAR NOT NULL,
+                    filiere VARCHAR,
+                    product VARCHAR NOT NULL,
+                    rank INTEGER NOT NULL,
+                    zone_id INTEGER NOT NULL,
+                    zone_name VARCHAR NOT NULL,
+                    region_name VARCHAR,
+                    tonnes FLOAT NOT NULL
+                )
+            '''))
+            db.session.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_production_ranking_level_product_filiere_rank '
+                'ON production_ranking (level, product, filiere, rank)'
+            ))
+            db.session.execute(text('''
+                CREATE TABLE IF NOT EXISTS data_version (
+                    id SERIAL PRIMARY KEY,
+                    version VARCHAR NOT NULL,
+                    loaded_at TIMESTAMP NOT NULL
+                )
+            '''))
+            # Morceaux (ST_Subdivide) des zones pour /api/aggregate, avec l'aire de la zone entière
+            db.session.execute(text('''
+                CREATE TABLE IF NOT EXISTS zone_subdivisions (
+                    id SERIAL PRIMARY KEY,
+                    level VARCHAR NOT NULL,
+                    zone_id INTEGER NOT NULL,
+                    zone_area FLOAT NOT NULL,
+                    geom GEOMETRY(GEOMETRY, 4326) NOT NULL
+                )
+            '''))
+            # Empreinte du dernier chargement réussi de chaque fichier source
+            db.session.execute(text('''
+                CREATE TABLE IF NOT EXISTS load_sources (
+                    source VARCHAR PRIMARY KEY,
+                    fingerprint VARCHAR NOT NULL,
+                    loaded_at TIMESTAMP NOT NULL
+                )
+            '''))
 
             db.session.commit()
-            print("Tables created successfully via raw SQL.")
+            print("Tables ensured via raw SQL.")
         except Exception as e:
             db.session.rollback()
             print(f"Error during database initialization: {e}")
             raise
 
-def populate_database():
-    with app.app_context():
-        # Step 1: Populate Regions, Departments, and Communes first
-        print("Populating Regions...")
-        regions_geojson = load_geojson('cmr_admin1.geojson')
-        regions_map = {f['properties']['adm1_name1']: f for f in regions_geojson['features']}
-        
-        region_objects = {}
-        for name, feature in regions_map.items():
-            geom = from_shape(shape(feature['geometry']), srid=4326)
-            region = Region(name=name, geom=geom)
-            db.session.add(region)
-            region_objects[name] = region
-        db.session.commit()
-        print(f"Loaded {len(region_objects)} regions.")
-
-        print("Populating Departments...")
-        departments_geojson = load_geojson('cmr_admin2.geojson')
-        department_objects = {}
-        for feature in departments_geojson['features']:
-            props = feature['properties']
-            dept_name = props['adm2_name1']
-            region_name = props['adm1_name1']
-            region = region_objects.get(region_name)
-            if not region:
-                continue
-            geom = from_shape(shape(feature['geometry']), srid=4326)
-            department = Department(name=dept_name, geom=geom, region=region)
-            db.session.add(department)
-            department_objects[dept_name] = department
-        db.session.commit()
-        print(f"Loaded {len(department_objects)} departments.")
-
-        print("Populating Communes...")
-        communes_geojson = load_geojson('cmr_admin3.geojson')
-        for feature in communes_geojson['features']:
+# Fichiers GeoJSON des limites administratives: (fichier, table, propriété du nom, propriété du parent)
+BOUNDARY_SOURCES = (
+    ('cmr_admin1.geojson', 'regions', 'adm1_name1', None),
+    ('cmr_admin2.geojson', 'departments', 'adm2_name1', 'adm1_name1'),
+    ('cmr_admin3.geojson', 'communes', 'adm3_name1', 'adm2_name1'),
+)
+
+# Fichiers CSV de production par filière
+PRODUCTION_SOURCES = (
+    ('./ObservationData_agriculture.csv', 'Agriculture'),
+    ('./ObservationData_elevage.csv', 'Élevage'),
+    ('./ObservationData_peche.csv', 'Pêche'),
+)
+
+def file_fingerprint(filepath):
+    """SHA-256 du contenu d'un fichier, ou 'missing' s'il n'existe pas."""
+    if not os.path.exists(filepath):
+        return 'missing'
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# À incrémenter quand le format des données chargées change, pour forcer un rechargement
+LOADER_SCHEMA_VERSION = '2'
+
+def source_fingerprints():
+    """Empreintes de toutes les sources, indexées par nom de fichier."""
+    fingerprints = {'schema': LOADER_SCHEMA_VERSION}
+    for filename, _, _, _ in BOUNDARY_SOURCES:
+        fingerprints[filename] = file_fingerprint(os.path.join(DATA_DIR, filename))
+    for filepath, _ in PRODUCTION_SOURCES:
+        fingerprints[os.path.basename(filepath)] = file_fingerprint(filepath)
+    return fingerprints
+
+def changed_sources(cursor, fingerprints):
+    """Sources dont l'empreinte diffère du dernier chargement réussi."""
+    cursor.execute('SELECT source, fingerprint FROM load_sources')
+    loaded = dict(cursor.fetchall())
+    return {source for source, fingerprint in fingerprints.items() if loaded.get(source) != fingerprint}
+
+def to_ewkb_hex(geometry):
+    """
+    Convertit une géométrie GeoJSON en EWKB hexadécimal (SRID 4326), telle quelle:
+    la réparation et le passage en MULTIPOLYGON se font ensuite dans PostGIS.
+    """
+    return wkb.dumps(shape(geometry), hex=True, srid=4326)
+
+class CsvRowStream:
+    """
+    Fichier en lecture seule qui produit le CSV des lignes à la demande,
+    pour que COPY consomme les lignes au fil de l'eau sans tout bufferiser.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out)
+        self._buffer = ''
+        self._pos = 0
+        self.count = 0
+
+    def _fill(self):
+        """Recharge le tampon avec la ligne suivante; False quand il n'y en a plus."""
+        row = next(self._rows, None)
+        if row is None:
+            return False
+        self._out.seek(0)
+        self._out.truncate()
+        self._writer.writerow(['' if value is None else value for value in row])
+        self._buffer, self._pos = self._out.getvalue(), 0
+        self.count += 1
+        return True
+
+    def read(self, size=-1):
+        parts = []
+        remaining = size if size >= 0 else float('inf')
+        while remaining > 0:
+            if self._pos >= len(self._buffer) and not self._fill():
+                break
+            part = self._buffer[self._pos:self._pos + remaining] if size >= 0 else self._buffer[self._pos:]
+            self._pos += len(part)
+            remaining -= len(part)
+            parts.append(part)
+        return ''.join(parts)
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Envoie les lignes dans `table` avec COPY ... FROM STDIN (format CSV), au fil
+    de leur production. Les valeurs None deviennent NULL. Retourne le nombre de lignes chargées.
+    """
+    started = time.perf_counter()
+    stream = CsvRowStream(rows)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        stream
+    )
+    count = stream.count
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"  {table}: {count} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return count
+
+def build_load_indexes(cursor):
+    """
+    Crée les index de clés étrangères et spatiaux s'ils manquent, puis ANALYZE.
+    Au premier chargement ils sont donc construits en une fois après le chargement en masse;
+    ensuite ils sont conservés: les supprimer prendrait un verrou ACCESS EXCLUSIVE
+    jusqu'au COMMIT et bloquerait l'API, et seules les zones modifiées y sont réécrites.
+    """
+    print("Creating indexes...")
+    started = time.perf_counter()
+    for statement in (
+        'CREATE INDEX IF NOT EXISTS ix_departments_region_id ON departments (region_id)',
+        'CREATE INDEX IF NOT EXISTS ix_communes_department_id ON communes (department_id)',
+        'CREATE INDEX IF NOT EXISTS ix_production_data_region_id ON production_data (region_id)',
+    ):
+        cursor.execute(statement)
+    # Index spatiaux (bbox, recherche par point, tuiles): les modèles déclarent
+    # spatial_index=True mais les tables sont créées en SQL brut
+    for table in ('regions', 'departments', 'communes'):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_geom ON {table} USING GIST (geom)')
+    for table in ('regions', 'departments', 'communes', 'production_data'):
+        cursor.execute(f'ANALYZE {table}')
+    print(f"Indexes created in {time.perf_counter() - started:.2f}s.")
+
+# Zones filles de chaque niveau (table, colonne du parent) et colonne de production_data
+ZONE_CHILDREN = {'regions': ('departments', 'region_id'), 'departments': ('communes', 'department_id')}
+ZONE_FOREIGN_KEYS = {'regions': 'region_id', 'departments': 'department_id', 'communes': 'commune_id'}
+
+def delete_zones(cursor, table, ids_sql):
+    """
+    Supprime les zones de `table` dont l'id est renvoyé par la requête `ids_sql`,
+    avec leurs zones filles et les lignes de production qui y font référence.
+    Retourne le nombre de zones de `table` supprimées.
+    """
+    child = ZONE_CHILDREN.get(table)
+    if child:
+        child_table, parent_column = child
+        delete_zones(cursor, child_table, f'SELECT id FROM {child_table} WHERE {parent_column} IN ({ids_sql})')
+    cursor.execute(f'DELETE FROM production_data WHERE {ZONE_FOREIGN_KEYS[table]} IN ({ids_sql})')
+    if table == 'regions':
+        cursor.execute(f'DELETE FROM region_counts WHERE region_id IN ({ids_sql})')
+    cursor.execute(f'DELETE FROM {table} WHERE id IN ({ids_sql})')
+    return cursor.rowcount
+
+def load_boundaries(cursor, filename, table, name_property, parent_property):
+    """
+    Charge un fichier de limites dans une table temporaire par COPY, puis
+    insère les nouvelles zones et met à jour celles dont la géométrie ou le parent a changé.
+    Les zones inchangées ne sont pas réécrites; celles absentes du fichier sont supprimées.
+    Retourne le nombre de zones supprimées.
+    """
+    print(f"Populating {table.capitalize()}...")
+
+    def rows():
+        # Feature par feature: lue, convertie en WKB et envoyée à COPY avant la suivante
+        seen = set()
+        for feature in iter_geojson_features(filename):
             props = feature['properties']
-            commune_name = props['adm3_name1']
-            dept_name = props['adm2_name1']
-            department = department_objects.get(dept_name)
-            if not department:
-                continue
-            geom = from_shape(shape(feature['geometry']), srid=4326)
-            commune = Commune(name=commune_name, geom=geom, department=department)
-            db.session.add(commune)
-        db.session.commit()
-        print("Communes loaded.")
-
-        # Step 2: Load production data from CSV files
-        print("Loading production data from CSV files...")
-        agriculture_data = load_csv_data('./ObservationData_agriculture.csv', 'Agriculture')
-        elevage_data = load_csv_data('./ObservationData_elevage.csv', 'Élevage')
-        peche_data = load_csv_data('./ObservationData_peche.csv', 'Pêche')
-        
-        # Step 3: Populate Production Data for regions only
-        print("Populating Production Data at region level...")
-        db.session.query(ProductionData).delete()
-        db.session.commit()
-
-        # Process Agriculture data
-        for region_name, products in agriculture_data.items():
-            region = region_objects.get(region_name)
-            if not region:
-                print(f"  Warning: Region '{region_name}' not found in GeoJSON")
-                continue
-            
-            for product, tonnes in products.items():
-                if tonnes > 0:
-                    db.session.add(ProductionData(
-                        filiere='Agriculture',
-                        product=product,
-                        tonnes=tonnes,
-                        region=region
-                    ))
-        
-        # Process Élevage data
-        for region_name, products in elevage_data.items():
-            region = region_objects.get(region_name)
-            if not region:
-                print(f"  Warning: Region '{region_name}' not found in GeoJSON")
+            name = props[name_property]
+            if name in seen:
                 continue
-            
-            for product, tonnes in products.items():
-                if tonnes > 0:
-                    db.session.add(ProductionData(
-                        filiere='Élevage',
-                        product=product,
-                        tonnes=tonnes,
-                        region=region
-                    ))
-        
-        # Process Pêche data
-        for region_name, products in peche_data.items():
-            region = region_objects.get(region_name)
-            if not region:
-                print(f"  Warning: Region '{region_name}' not found in GeoJSON")
+            seen.add(name)
+            parent = props[parent_property] if parent_property else None
+            yield (name, to_ewkb_hex(feature['geometry']), parent)
+
+    cursor.execute('TRUNCATE staging_zones')
+    copy_rows(cursor, 'staging_zones', ('name', 'geom', 'parent_name'), rows())
+
+    # Réparation en masse côté serveur: géométries valides, polygones seuls, en MULTIPOLYGON
+    cursor.execute("""
+        UPDATE staging_zones
+        SET geom = ST_Multi(ST_CollectionExtract(ST_MakeValid(geom), 3))
+        WHERE NOT ST_IsValid(geom) OR GeometryType(geom) <> 'MULTIPOLYGON'
+    """)
+    if cursor.rowcount:
+        print(f"  {table}: {cursor.rowcount} geometries repaired or converted to MULTIPOLYGON.")
+    cursor.execute('DELETE FROM staging_zones WHERE geom IS NULL OR ST_IsEmpty(geom)')
+    if cursor.rowcount:
+        print(f"  {table}: {cursor.rowcount} empty geometries skipped.")
+
+    reset_lods = 'geom_lod1 = NULL, geom_lod2 = NULL, geom_lod3 = NULL'
+    if table == 'regions':
+        cursor.execute(f"""
+            INSERT INTO regions (name, geom)
+            SELECT name, geom FROM staging_zones
+            ON CONFLICT (name) DO UPDATE SET geom = EXCLUDED.geom, {reset_lods}
+            WHERE regions.geom IS DISTINCT FROM EXCLUDED.geom
+        """)
+    else:
+        parent_table, parent_column = ('regions', 'region_id') if table == 'departments' \
+            else ('departments', 'department_id')
+        # Les zones dont le parent est inconnu sont ignorées
+        cursor.execute(f"""
+            INSERT INTO {table} (name, geom, {parent_column})
+            SELECT s.name, s.geom, parent.id
+            FROM staging_zones s
+            JOIN {parent_table} parent ON parent.name = s.parent_name
+            ON CONFLICT (name) DO UPDATE
+            SET geom = EXCLUDED.geom, {parent_column} = EXCLUDED.{parent_column}, {reset_lods}
+            WHERE {table}.geom IS DISTINCT FROM EXCLUDED.geom
+               OR {table}.{parent_column} IS DISTINCT FROM EXCLUDED.{parent_column}
+        """)
+    print(f"  {table}: {cursor.rowcount} zones inserted or updated.")
+
+    # Zones supprimées ou renommées dans le fichier
+    deleted = delete_zones(cursor, table, f"""
+        SELECT z.id FROM {table} z
+        WHERE NOT EXISTS (SELECT 1 FROM staging_zones s WHERE s.name = z.name)
+    """)
+    if deleted:
+        print(f"  {table}: {deleted} zones no longer in {filename} deleted.")
+    return deleted
+
+def load_production(cursor, sources):
+    """
+    Upsert des données de production régionales des filières `sources`.
+    Les lignes absentes du nouveau fichier sont supprimées, les autres ne sont
+    réécrites que si le tonnage a changé.
+    """
+    print("Loading production data from CSV files...")
+    batches = read_production_sources(sources)
+
+    cursor.execute('TRUNCATE staging_production')
+    copy_rows(cursor, 'staging_production', ('filiere', 'product', 'year', 'tonnes', 'region_name'),
+              itertools.chain.from_iterable(batch.rows() for batch in batches))
+
+    cursor.execute("""
+        SELECT DISTINCT s.region_name FROM staging_production s
+        WHERE NOT EXISTS (SELECT 1 FROM regions r WHERE r.name = s.region_name)
+    """)
+    for (region_name,) in cursor.fetchall():
+        print(f"  Warning: Region '{region_name}' not found in GeoJSON")
+
+    print("Populating Production Data at region level...")
+    filieres = [filiere for _, filiere in sources]
+    cursor.execute("""
+        DELETE FROM production_data p
+        WHERE p.filiere = ANY(%(filieres)s)
+          AND p.department_id IS NULL AND p.commune_id IS NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM staging_production s
+              JOIN regions r ON r.name = s.region_name
+              WHERE s.filiere = p.filiere AND s.product = p.product
+                AND s.year IS NOT DISTINCT FROM p.year AND r.id = p.region_id
+          )
+    """, {'filieres': filieres})
+    deleted = cursor.rowcount
+    cursor.execute("""
+        INSERT INTO production_data (filiere, product, year, tonnes, region_id)
+        SELECT s.filiere, s.product, s.year, s.tonnes, r.id
+        FROM staging_production s
+        JOIN regions r ON r.name = s.region_name
+        ON CONFLICT (filiere, product, region_id, year) WHERE department_id IS NULL AND commune_id IS NULL
+        DO UPDATE SET tonnes = EXCLUDED.tonnes
+        WHERE production_data.tonnes IS DISTINCT FROM EXCLUDED.tonnes
+    """)
+    print(f"  production_data: {cursor.rowcount} rows upserted, {deleted} deleted.")
+
+def build_geometry_lods(cursor):
+    """
+    Précalcule les géométries simplifiées (ST_SimplifyPreserveTopology) de
+    chaque niveau de détail, pour qu'aucune simplification ne soit faite par requête.
+    Seules les zones nouvelles ou modifiées (niveaux de détail à NULL) sont recalculées.
+    """
+    print("Building simplified geometries...")
+    for table in ('regions', 'departments', 'communes'):
+        for column, tolerance, _, _ in GEOMETRY_LODS:
+            if column == 'geom':
                 continue
-            
-            for product, tonnes in products.items():
-                if tonnes > 0:
-                    db.session.add(ProductionData(
-                        filiere='Pêche',
-                        product=product,
-                        tonnes=tonnes,
-                        region=region
-                    ))
-        
-        db.session.commit()
-        print("Production data populated at region level.")
+            cursor.execute(
+                f'UPDATE {table} SET {column} = '
+                f'ST_Multi(ST_SimplifyPreserveTopology(geom, %(tolerance)s)) '
+                f'WHERE {column} IS NULL',
+                {'tolerance': tolerance}
+            )
+    print("Simplified geometries built.")
+
+# Niveaux découpés pour /api/aggregate et nombre maximal de sommets par morceau
+SUBDIVIDED_LEVELS = ('departments', 'communes')
+SUBDIVIDE_MAX_VERTICES = int(os.getenv("SUBDIVIDE_MAX_VERTICES", "256"))
+
+def build_zone_subdivisions(cursor, boundaries_changed):
+    """
+    Découpe les zones en morceaux d'au plus SUBDIVIDE_MAX_VERTICES sommets (ST_Subdivide),
+    indexés en GIST: une intersection avec un polygone quelconque ne teste alors que
+    quelques petits morceaux au lieu d'une frontière complète. L'aire de la zone
+    entière est gardée pour pondérer la production par la part d'aire couverte.
+    """
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM zone_subdivisions)')
+    if not boundaries_changed and cursor.fetchone()[0]:
+        print("Boundaries unchanged, zone subdivisions kept.")
+        return
+    print("Building zone subdivisions...")
+    started = time.perf_counter()
+    cursor.execute('DELETE FROM zone_subdivisions')
+    for level in SUBDIVIDED_LEVELS:
+        # Aires en degrés carrés: seul le rapport entre l'intersection et la zone compte
+        cursor.execute(f"""
+            INSERT INTO zone_subdivisions (level, zone_id, zone_area, geom)
+            SELECT %(level)s, id, ST_Area(geom), ST_Subdivide(geom, %(max_vertices)s)
+            FROM {level}
+            WHERE geom IS NOT NULL AND ST_Area(geom) > 0
+        """, {'level': level, 'max_vertices': SUBDIVIDE_MAX_VERTICES})
+    # Construit après le premier remplissage de la table plutôt que maintenu ligne à ligne
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_zone_subdivisions_geom ON zone_subdivisions USING GIST (geom)')
+    cursor.execute('ANALYZE zone_subdivisions')
+    print(f"Zone subdivisions built in {time.perf_counter() - started:.2f}s.")
+
+def build_production_rollup(cursor):
+    """
+    Pré-agrège production_data par zone pour les trois niveaux de l'API, par année
+    et toutes années confondues (year NULL).
+    Les données régionales sont réparties uniformément entre les départements
+    et communes de la région, comme le faisaient auparavant les endpoints.
+    """
+    print("Building production rollup...")
+    cursor.execute('DELETE FROM production_rollup')
+    cursor.execute('DELETE FROM region_counts')
+
+    # Nombre de départements et de communes par région
+    cursor.execute("""
+        INSERT INTO region_counts (region_id, dept_count, commune_count)
+        SELECT r.id,
+               (SELECT COUNT(*) FROM departments d WHERE d.region_id = r.id),
+               (SELECT COUNT(*) FROM communes c
+                  JOIN departments d ON c.department_id = d.id
+                 WHERE d.region_id = r.id)
+        FROM regions r
+    """)
+
+    # Production régionale
+    cursor.execute("""
+        INSERT INTO production_rollup (level, zone_id, zone_name, region_name, filiere, product, year, tonnes)
+        SELECT 'regions', r.id, r.name, NULL, p.filiere, p.product, p.year, SUM(p.tonnes)
+        FROM regions r
+        JOIN production_data p ON p.region_id = r.id
+        WHERE p.department_id IS NULL AND p.commune_id IS NULL
+        GROUP BY GROUPING SETS (
+            (r.id, r.name, p.filiere, p.product, p.year),
+            (r.id, r.name, p.filiere, p.product)
+        )
+    """)
+
+    # Production régionale divisée par le nombre de départements
+    cursor.execute("""
+        INSERT INTO production_rollup (level, zone_id, zone_name, region_name, filiere, product, year, tonnes)
+        SELECT 'departments', d.id, d.name, r.name, p.filiere, p.product, p.year, SUM(p.tonnes) / rc.dept_count
+        FROM departments d
+        JOIN regions r ON d.region_id = r.id
+        JOIN region_counts rc ON rc.region_id = r.id
+        JOIN production_data p ON p.region_id = r.id
+        WHERE p.department_id IS NULL AND p.commune_id IS NULL
+        GROUP BY GROUPING SETS (
+            (d.id, d.name, r.name, p.filiere, p.product, rc.dept_count, p.year),
+            (d.id, d.name, r.name, p.filiere, p.product, rc.dept_count)
+        )
+    """)
+
+    # Production régionale divisée par le nombre de communes
+    cursor.execute("""
+        INSERT INTO production_rollup (level, zone_id, zone_name, region_name, filiere, product, year, tonnes)
+        SELECT 'communes', c.id, c.name, r.name, p.filiere, p.product, p.year, SUM(p.tonnes) / rc.commune_count
+        FROM communes c
+        JOIN departments d ON c.department_id = d.id
+        JOIN regions r ON d.region_id = r.id
+        JOIN region_counts rc ON rc.region_id = r.id
+        JOIN production_data p ON p.region_id = r.id
+        WHERE p.department_id IS NULL AND p.commune_id IS NULL
+        GROUP BY GROUPING SETS (
+            (c.id, c.name, r.name, p.filiere, p.product, rc.commune_count, p.year),
+            (c.id, c.name, r.name, p.filiere, p.product, rc.commune_count)
+        )
+    """)
+
+    cursor.execute('ANALYZE production_rollup')
+    print("Production rollup built.")
+
+def build_production_ranking(cursor):
+    """
+    Classe les zones de chaque niveau par tonnage toutes années confondues, pour chaque
+    (filière, produit) et pour chaque produit toutes filières confondues (filiere NULL).
+    Un top N ou une page du classement est alors un simple parcours d'index sur le rang.
+    """
+    print("Building production ranking...")
+    cursor.execute('DELETE FROM production_ranking')
+    cursor.execute("""
+        INSERT INTO production_ranking (level, filiere, product, rank, zone_id, zone_name, region_name, tonnes)
+        SELECT level, filiere, product,
+               ROW_NUMBER() OVER (PARTITION BY level, filiere, product ORDER BY tonnes DESC, zone_id),
+               zone_id, zone_name, region_name, tonnes
+        FROM (
+            SELECT level, filiere, product, zone_id, zone_name, region_name, tonnes
+            FROM production_rollup
+            WHERE year IS NULL
+            UNION ALL
+            SELECT level, NULL, product, zone_id, zone_name, region_name, SUM(tonnes)
+            FROM production_rollup
+            WHERE year IS NULL
+            GROUP BY level, product, zone_id, zone_name, region_name
+        ) totals
+    """)
+    cursor.execute('ANALYZE production_ranking')
+    print("Production ranking built.")
+
+def stamp_data_version(cursor):
+    """
+    Écrit une nouvelle version des données. L'API s'en sert pour invalider
+    ses caches de réponses après chaque chargement.
+    """
+    version = f"{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    cursor.execute(
+        'INSERT INTO data_version (version, loaded_at) VALUES (%(version)s, %(loaded_at)s)',
+        {'version': version, 'loaded_at': datetime.utcnow()}
+    )
+    print(f"Data version stamped: {version}")
+    return version
+
+def record_fingerprints(cursor, fingerprints):
+    """Mémorise l'empreinte des sources chargées."""
+    for source, fingerprint in fingerprints.items():
+        cursor.execute("""
+            INSERT INTO load_sources (source, fingerprint, loaded_at)
+            VALUES (%(source)s, %(fingerprint)s, %(loaded_at)s)
+            ON CONFLICT (source) DO UPDATE
+            SET fingerprint = EXCLUDED.fingerprint, loaded_at = EXCLUDED.loaded_at
+        """, {'source': source, 'fingerprint': fingerprint, 'loaded_at': datetime.utcnow()})
+
+def populate_database(force=False):
+    """
+    Recharge les sources modifiées depuis le dernier chargement, dans une seule
+    transaction: l'API continue de servir les anciennes données jusqu'au COMMIT.
+    Ne fait rien si aucune source n'a changé (sauf avec `force=True`).
+    """
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            # Attend la fin d'un chargement en cours avant de lire les empreintes
+            cursor.execute('SELECT pg_advisory_xact_lock(%(id)s)', {'id': LOAD_LOCK_ID})
+            fingerprints = source_fingerprints()
+            changed = set(fingerprints) if force else changed_sources(cursor, fingerprints)
+            if not changed:
+                print("All sources unchanged since the last load, nothing to reload.")
+                connection.rollback()
+                return False
+            print(f"Changed sources: {', '.join(sorted(changed))}")
+
+            cursor.execute("""
+                CREATE TEMP TABLE staging_zones (
+                    name VARCHAR, geom GEOMETRY(GEOMETRY, 4326), parent_name VARCHAR
+                ) ON COMMIT DROP
+            """)
+            cursor.execute("""
+                CREATE TEMP TABLE staging_production (
+                    filiere VARCHAR, product VARCHAR, year INTEGER, tonnes FLOAT, region_name VARCHAR
+                ) ON COMMIT DROP
+            """)
+
+            # Step 1: Regions, Departments and Communes, parents first
+            boundaries_changed = False
+            reload_children = False
+            for filename, table, name_property, parent_property in BOUNDARY_SOURCES:
+                if filename in changed or reload_children:
+                    deleted = load_boundaries(cursor, filename, table, name_property, parent_property)
+                    boundaries_changed = True
+                    # Les zones filles des zones supprimées l'ont été avec elles:
+                    # les niveaux suivants sont rechargés même si leur fichier n'a pas changé
+                    reload_children = reload_children or deleted > 0
+
+            # Step 2: Production data. De nouvelles régions peuvent rendre valides
+            # des lignes ignorées auparavant: on recharge alors toutes les filières
+            production_sources = [
+                (filepath, filiere) for filepath, filiere in PRODUCTION_SOURCES
+                if boundaries_changed or os.path.basename(filepath) in changed
+            ]
+            if production_sources:
+                load_production(cursor, production_sources)
+
+            build_load_indexes(cursor)
+            build_geometry_lods(cursor)
+            build_zone_subdivisions(cursor, boundaries_changed)
+            build_production_rollup(cursor)
+            build_production_ranking(cursor)
+            stamp_data_version(cursor)
+            record_fingerprints(cursor, fingerprints)
+
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
         print("Database population complete!")
+        return True
 
 if __name__ == '__main__':
-    init_db_and_extensions()
-    populate_database()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Charge les limites administratives et la production dans PostGIS.")
+    parser.add_argument('--force', action='store_true', help="recharger toutes les sources même inchangées")
+    parser.add_argument('--rebuild', action='store_true', help="supprimer et recréer les tables avant le chargement")
+    args = parser.parse_args()
+
+    init_db_and_extensions(rebuild=args.rebuild)
+    populate_database(force=args.force or args.rebuild)
+
+    # Réexporte les fichiers servis par nginx après chaque chargement, sans quoi
+    # current/ resterait à l'ancienne version (l'export est sauté si elle est à jour)
+    if os.getenv("SNAPSHOT_DIR"):
+        from export_snapshot import export_snapshot
+        try:
+            export_snapshot()
+        except Exception as e:
+            print(f"Snapshot export failed, all requests will go through Flask: {e}")
@@ -0,0 +1,290 @@
+"""
+Benchmark reproductible du chargeur et de l'API sur des données synthétiques.
+
+    docker compose -f benchmarks/docker-compose.yml up -d
+    python benchmarks/run.py --scale 10 --output bench-x10.json
+
+Étapes mesurées:
+  1. génération des données synthétiques (benchmarks/synthetic.py);
+  2. phases de populate_db.py (limites, production, index, géométries simplifiées, découpage, rollup,
+     classement);
+  3. chaque route /api/<niveau>, avec et sans `filiere`, à froid (caches vidés) et à chaud;
+  4. build_geojson_response seul, sur des lignes déjà en mémoire.
+
+Le résultat (JSON) contient les percentiles de latence, le débit, la taille des
+réponses et la mémoire résidente échantillonnée pendant chaque mesure (RSS au début,
+pic et croissance), pour comparer deux versions. `process_peak_rss_mb` est le pic
+de tout le processus depuis son démarrage, pas celui d'une étape.
+La base ciblée est vidée: utiliser DB_* pour pointer sur une instance dédiée.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(REPO_DIR, 'backend')
+
+# Base PostGIS locale de benchmarks/docker-compose.yml par défaut
+os.environ.setdefault('DB_PORT', '55432')
+os.environ.setdefault('DB_NAME', 'geoproduction_bench')
+os.environ.setdefault('WARMUP', '0')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+
+try:
+    import psutil
+except ImportError:  # /proc suffit sous Linux
+    psutil = None
+
+FILIERES = (None, 'Agriculture', 'Élevage', 'Pêche')
+LOADER_PHASES = ('init_db_and_extensions', 'load_boundaries', 'load_production', 'build_load_indexes',
+                 'build_geometry_lods', 'build_zone_subdivisions', 'build_production_rollup',
+                 'build_production_ranking')
+
+
+def process_peak_rss_mb():
+    """Pic de mémoire résidente du processus depuis son démarrage (Mo), toutes étapes confondues."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sur macOS, en kilo-octets ailleurs
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_bytes():
+    """Mémoire résidente actuelle du processus (octets), None si elle ne peut pas être lue."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+class RssSampler:
+    """
+    Échantillonne la mémoire résidente dans un thread pendant un bloc `with`:
+    contrairement à ru_maxrss, le pic mesuré est propre au bloc.
+    Plusieurs blocs d'une même étape gardent le plus grand pic.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start = self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        rss = current_rss_bytes()
+        if rss is None:
+            return self
+        self._stop.clear()
+        self._sample()
+        start = rss if self.start is None else min(self.start, rss)
+        self.start = start
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._sample()
+        return False
+
+    def result(self):
+        """RSS au début, pic et croissance pendant les blocs (Mo); vide si la RSS est illisible."""
+        if self.start is None:
+            return {}
+        mb = 1024 * 1024
+        return {
+            'rss_start_mb': self.start / mb,
+            'rss_peak_mb': self.peak / mb,
+            'rss_growth_mb': (self.peak - self.start) / mb,
+        }
+
+
+def summarize(durations, payload_bytes=None, memory=None):
+    """Percentiles (ms), débit, taille de réponse et mémoire (RssSampler) d'une série de mesures."""
+    durations = sorted(durations)
+    total = sum(durations)
+
+    def percentile(p):
+        return durations[min(len(durations) - 1, int(round(p / 100 * (len(durations) - 1))))] * 1000
+
+    result = {
+        'runs': len(durations),
+        'mean_ms': statistics.mean(durations) * 1000,
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p99_ms': percentile(99),
+        'max_ms': durations[-1] * 1000,
+        'throughput_rps': len(durations) / total if total else None,
+    }
+    if memory is not None:
+        result.update(memory.result())
+    if payload_bytes is not None:
+        result['payload_bytes'] = payload_bytes
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_loader(data_dir):
+    """Charge les données synthétiques en chronométrant chaque phase de populate_db."""
+    os.environ['DATA_DIR'] = data_dir
+    # Les CSV de production sont lus relativement au dossier courant
+    os.chdir(data_dir)
+    import populate_db
+
+    timings = {phase: 0.0 for phase in LOADER_PHASES}
+    memory = {phase: RssSampler() for phase in LOADER_PHASES}
+
+    def timed(name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with memory[name]:
+                    return function(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - started
+        return wrapper
+
+    for phase in LOADER_PHASES:
+        setattr(populate_db, phase, timed(phase, getattr(populate_db, phase)))
+
+    started = time.perf_counter()
+    populate_db.init_db_and_extensions(rebuild=True)
+    populate_db.populate_database(force=True)
+    total = time.perf_counter() - started
+    return {
+        'total_s': total,
+        'phases_s': timings,
+        'phases_memory': {phase: sampler.result() for phase, sampler in memory.items()},
+    }
+
+
+def bench_routes(runs):
+    """Latence de chaque route de niveau, à froid puis à chaud, avec et sans filière."""
+    import app as api
+
+    client = api.app.test_client()
+    results = {}
+    for level in api.ZONE_MODELS:
+        for filiere in FILIERES:
+            url = f'/api/{level}' + (f'?filiere={filiere}' if filiere else '')
+            for mode in ('cold', 'warm'):
+                durations = []
+                payload = gzipped = None
+                memory = RssSampler()
+                for _ in range(runs):
+                    if mode == 'cold':
+                        api.response_cache.clear()
+                        api.geometry_cache.clear()
+                    with memory:
+                        started = time.perf_counter()
+                        response = client.get(url)
+                        durations.append(time.perf_counter() - started)
+                    assert response.status_code == 200, (url, response.status_code)
+                    payload = len(response.get_data())
+                gzipped = len(client.get(url, headers={'Accept-Encoding': 'gzip'}).get_data())
+                summary = summarize(durations, payload, memory)
+                summary['payload_gzip_bytes'] = gzipped
+                results[f'{url} [{mode}]'] = summary
+    return results
+
+
+def bench_build_geojson(runs):
+    """build_geojson_response seul, sur les lignes et géométries déjà chargées."""
+    import app as api
+
+    results = {}
+    with api.app.app_context():
+        for level in api.ZONE_MODELS:
+            rows = api.query_rollup(level)
+            geometries = api.zone_geometries(level)
+            durations = []
+            memory = RssSampler()
+            for _ in range(runs):
+                with memory:
+                    started = time.perf_counter()
+                    body = api.build_geojson_response(rows, geometries)
+                    durations.append(time.perf_counter() - started)
+            summary = summarize(durations, len(body), memory)
+            summary['rows'] = len(rows)
+            results[level] = summary
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1, help="facteur d'échelle des données synthétiques")
+    parser.add_argument('--runs', type=int, default=20, help='requêtes par route et par mode')
+    parser.add_argument('--data-dir', help='dossier des données synthétiques (temporaire par défaut)')
+    parser.add_argument('--skip-loader', action='store_true', help='réutiliser la base déjà chargée')
+    parser.add_argument('--output', default='benchmark.json', help='fichier de résultats JSON')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    report = {
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'runs': args.runs,
+    }
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix=f'geoprod-x{args.scale}-')
+    if not args.skip_loader:
+        started = time.perf_counter()
+        report['dataset'] = synthetic.generate(data_dir, args.scale)
+        report['dataset']['generation_s'] = time.perf_counter() - started
+        print(f"Synthetic data x{args.scale} in {data_dir}: {report['dataset']['zones']}")
+        report['loader'] = bench_loader(data_dir)
+        print(f"Loader: {report['loader']['total_s']:.2f}s")
+
+    report['routes'] = bench_routes(args.runs)
+    report['build_geojson_response'] = bench_build_geojson(args.runs)
+    report['process_peak_rss_mb'] = process_peak_rss_mb()
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for name, summary in report['routes'].items():
+        print(f"{name:45s} p50 {summary['p50_ms']:9.1f} ms  p99 {summary['p99_ms']:9.1f} ms  "
+              f"{summary['payload_bytes'] / 1024:9.0f} KiB")
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Génère un jeu de données synthétique à l'échelle voulue pour les benchmarks:
+limites administratives (cmr_admin1/2/3.geojson) et fichiers ObservationData_*.csv.
+
+    python benchmarks/synthetic.py --scale 10 --output /tmp/geoprod-x10
+
+Les 10 régions gardent leurs vrais noms (pour la correspondance avec les CSV),
+départements et communes sont des subdivisions rectangulaires de chaque région.
+À l'échelle 1 on obtient 58 départements et 360 communes comme au Cameroun, et
+des CSV de la taille de ceux livrés dans backend/. L'échelle multiplie le nombre
+de départements, de communes et de lignes de production.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_DIR, 'backend')
+
+REGIONS = ('Adamaoua', 'Centre', 'Est', 'Extrême-Nord', 'Littoral',
+           'Nord', 'Nord-Ouest', 'Ouest', 'Sud', 'Sud-Ouest')
+BASE_DEPARTMENTS = 58
+BASE_COMMUNES = 360
+CSV_FILES = ('ObservationData_agriculture.csv', 'ObservationData_elevage.csv', 'ObservationData_peche.csv')
+
+# Emprise approximative du Cameroun
+MIN_LON, MIN_LAT, MAX_LON, MAX_LAT = 8.5, 1.7, 16.2, 13.1
+
+
+def rectangle(minx, miny, maxx, maxy, vertices_per_edge):
+    """MultiPolygon rectangulaire avec des arêtes densifiées (pour un volume réaliste)."""
+    ring = []
+    corners = ((minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny))
+    for (x0, y0), (x1, y1) in zip(corners, corners[1:]):
+        for i in range(vertices_per_edge):
+            t = i / vertices_per_edge
+            ring.append([round(x0 + (x1 - x0) * t, 6), round(y0 + (y1 - y0) * t, 6)])
+    ring.append(ring[0])
+    return {'type': 'MultiPolygon', 'coordinates': [[ring]]}
+
+
+def split(box, parts):
+    """Découpe un rectangle en `parts` cellules d'une grille presque carrée."""
+    minx, miny, maxx, maxy = box
+    columns = math.ceil(math.sqrt(parts))
+    rows = math.ceil(parts / columns)
+    width, height = (maxx - minx) / columns, (maxy - miny) / rows
+    cells = []
+    for index in range(parts):
+        column, row = index % columns, index // columns
+        cells.append((minx + column * width, miny + row * height,
+                      minx + (column + 1) * width, miny + (row + 1) * height))
+    return cells
+
+
+def distribute(total, buckets):
+    """Répartit `total` éléments entre `buckets` groupes (au moins un chacun)."""
+    base, extra = divmod(max(total, buckets), buckets)
+    return [base + (1 if i < extra else 0) for i in range(buckets)]
+
+
+def feature(properties, geometry):
+    return {'type': 'Feature', 'properties': properties, 'geometry': geometry}
+
+
+def write_boundaries(output, scale, vertices_per_edge):
+    """Écrit les trois niveaux de limites. Retourne le nombre de zones par niveau."""
+    regions, departments, communes = [], [], []
+    region_boxes = split((MIN_LON, MIN_LAT, MAX_LON, MAX_LAT), len(REGIONS))
+    dept_counts = distribute(BASE_DEPARTMENTS * scale, len(REGIONS))
+    commune_counts = iter(distribute(BASE_COMMUNES * scale, BASE_DEPARTMENTS * scale))
+
+    for region, region_box, dept_count in zip(REGIONS, region_boxes, dept_counts):
+        regions.append(feature({'adm1_name1': region}, rectangle(*region_box, vertices_per_edge)))
+        dept_boxes = split(region_box, dept_count)
+        for d, (dept_box, commune_count) in enumerate(zip(dept_boxes, commune_counts)):
+            dept_name = f'{region} D{d + 1}'
+            departments.append(feature({'adm1_name1': region, 'adm2_name1': dept_name},
+                                       rectangle(*dept_box, vertices_per_edge)))
+            for c, commune_box in enumerate(split(dept_box, commune_count)):
+                communes.append(feature({'adm2_name1': dept_name, 'adm3_name1': f'{dept_name} C{c + 1}'},
+                                        rectangle(*commune_box, vertices_per_edge)))
+
+    for filename, features in (('cmr_admin1.geojson', regions),
+                               ('cmr_admin2.geojson', departments),
+                               ('cmr_admin3.geojson', communes)):
+        with open(os.path.join(output, filename), 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f, ensure_ascii=False)
+    return {'regions': len(regions), 'departments': len(departments), 'communes': len(communes)}
+
+
+def write_production(output, scale):
+    """
+    Recopie les CSV livrés `scale` fois, avec des noms de produits distincts
+    à chaque copie. Retourne le nombre de lignes par fichier.
+    """
+    counts = {}
+    for filename in CSV_FILES:
+        with open(os.path.join(BACKEND_DIR, filename), encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = list(reader)
+        indicateur_col = header.index('indicateur')
+        with open(os.path.join(output, filename), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(header)
+            for copy in range(scale):
+                for row in rows:
+                    if copy:
+                        row = list(row)
+                        row[indicateur_col] = f'{row[indicateur_col]} variante {copy}'
+                    writer.writerow(row)
+        counts[filename] = len(rows) * scale
+    return counts
+
+
+def generate(output, scale=1, vertices_per_edge=25):
+    os.makedirs(output, exist_ok=True)
+    return {
+        'scale': scale,
+        'zones': write_boundaries(output, scale, vertices_per_edge),
+        'production_rows': write_production(output, scale),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1, help="facteur d'échelle (1, 10, 100, 1000...)")
+    parser.add_argument('--output', required=True, help='dossier de sortie')
+    parser.add_argument('--vertices-per-edge', type=int, default=25, help='sommets par côté de polygone')
+    args = parser.parse_args()
+    print(json.dumps(generate(args.output, args.scale, args.vertices_per_edge), indent=2, ensure_ascii=False))